@@ -1,26 +1,42 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from .models.pydantic_models import QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest
+from fastapi import FastAPI, File, Form, Query, UploadFile, HTTPException
+from .models.pydantic_models import ModelName, QueryInput, QueryResponse, DocumentInfo, DocumentStatus, DeleteFileRequest, SessionPage, HistoryPage
 from fastapi.security import OAuth2PasswordBearer
 from .models.user import UserRegister
-from .services.langchain_utils import get_rag_chain
+from .services.langchain_utils import get_rag_chain, astream_rag_answer, warm_rag_chains
 from .services.database import (
-      insert_application_logs,
-      get_chat_history, get_all_documents, 
+      get_all_documents, 
       insert_document_record, 
+      enqueue_ingestion_job,
+      get_document_ingestion_job,
       delete_document_record,
       get_user_by_email,
       insert_user,
       get_user_chat_history,
+      get_user_sessions,
+      get_session_history,
+      iter_user_chat_history,
       delete_chat_session,
       reset_password_db,
       delete_chat_history)
 from .services.vector_store_db import index_document_to_chroma, delete_doc_from_chroma, index_netsuite_docs, clear_vector_store
+from .services.page_cache import page_cache
+from .services.search_cache import search_cache
+from .services.semantic_cache import answer_cache
+from .services.embedding_cache import embedding_cache
+from .services.ingestion_queue import ingestion_worker, UPLOAD_DIR
+from .services.log_writer import log_writer
+from .services import http_client
+from .services.history_cache import history_cache
+from .services.bulk_ingest import register_files, submit_bulk_ingest
+from .services.document_loader import SUPPORTED_EXTENSIONS
 from .services.auth import decode_token, hash_password, create_access_token,verify_password
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import os
 import uuid
 import logging
 import shutil
+import json
 from typing import Dict, List
 
 # Set up logging
@@ -38,13 +54,6 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Document formats
-allowed_extensions = [
-    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.csv', '.txt',
-    '.jpeg', '.jpg', '.png',
-    '.html'
-]
-
 @app.on_event("startup")
 async def startup_event():
     """Initialize the application"""
@@ -55,13 +64,24 @@ async def startup_event():
             raise Exception("OPENAI_API_KEY environment variable is not set")
         if not os.getenv("SERPAPI_API_KEY"):
             raise Exception("SERPAPI_API_KEY environment variable is not set")
+        log_writer.start()
+        ingestion_worker.start()
+        # Build the LLM clients and chains now rather than on the first chat request
+        warm_rag_chains([model.value for model in ModelName])
         logging.info("Application started successfully")
     except Exception as e:
         logging.error(f"Error during startup: {str(e)}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    ingestion_worker.stop()
+    # Write out every chat turn still queued before the process exits
+    log_writer.stop()
+    await http_client.aclose()
+
 @app.post("/chat", response_model=QueryResponse)
-def chat(query_input: QueryInput):
+async def chat(query_input: QueryInput):
     # Comment out session ID generation for now
     # session_id = query_input.session_id or str(uuid.uuid4())
     session_id = "global_session"  # Use a constant session ID for now
@@ -70,27 +90,141 @@ def chat(query_input: QueryInput):
     print(f"🤖 Model: {query_input.model.value}")
 
     # Get chat history without session ID
-    chat_history = get_chat_history()
+    chat_history = await history_cache.aget()
     print(f"💬 Retrieved {len(chat_history)} previous conversation turns")
     
-    # Initialize RAG chain
+    # Shared per model; built at startup
     rag_chain = get_rag_chain(query_input.model.value)
     
     # Get answer
     print("\n🔄 Processing query through RAG chain...")
-    answer = rag_chain.invoke(
+    result = await rag_chain.ainvoke(
         {
             "input": query_input.question,
             "chat_history": chat_history
         }
-    )['answer']
+    )
+    answer = result['answer']
+    print(f"📚 Context retrieved from: {result['retrieval_source']}")
 
     # Log the interaction
-    insert_application_logs(session_id, query_input.question, answer, query_input.model.value)
+    record_turn(session_id, query_input, answer)
     print(f"✅ Response generated and logged")
     print(f"📝 AI Response: {answer}")
     
-    return QueryResponse(answer=answer, session_id=session_id, model=query_input.model)
+    return QueryResponse(
+        answer=answer,
+        session_id=session_id,
+        model=query_input.model,
+        retrieval_source=result['retrieval_source'],
+        sources=result['sources']
+    )
+
+def record_turn(session_id: str, query_input: QueryInput, answer: str):
+    """Queue the turn for the log table and add it to the cached history."""
+    log_writer.log(session_id, query_input.question, answer, query_input.model.value, query_input.user_id)
+    history_cache.append(session_id, query_input.question, answer)
+
+def format_sse(event: Dict) -> str:
+    """Serialize a pipeline event as a Server-Sent Events message."""
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(query_input: QueryInput):
+    """Stream the answer as Server-Sent Events while it is being generated."""
+    session_id = "global_session"  # Use a constant session ID for now
+    print(f"\n🆕 Session ID: {session_id}")
+    print(f"👤 User Query: {query_input.question}")
+    print(f"🤖 Model: {query_input.model.value}")
+
+    chat_history = await history_cache.aget()
+    print(f"💬 Retrieved {len(chat_history)} previous conversation turns")
+
+    async def event_stream():
+        answer = None
+        try:
+            yield format_sse({"event": "session", "session_id": session_id, "model": query_input.model.value})
+            async for event in astream_rag_answer(query_input.model.value, query_input.question, chat_history):
+                if event["event"] == "done":
+                    answer = event["answer"]
+                yield format_sse(event)
+        except Exception as e:
+            logging.error(f"Error streaming answer: {str(e)}")
+            yield format_sse({"event": "error", "detail": "Failed to generate answer"})
+        finally:
+            # Only log complete answers, not streams the client abandoned midway
+            if answer is not None:
+                record_turn(session_id, query_input, answer)
+                print(f"✅ Streamed response logged")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/upload-doc")
+def upload_document(file: UploadFile = File(...), user_id: int = Form(...)):
+    """Save an upload and queue it for indexing; poll /documents/{id}/status for progress"""
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    if file_extension not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type. Allowed types are: {', '.join(SUPPORTED_EXTENSIONS)}")
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{file_extension}")
+    try:
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        file_id = insert_document_record(file.filename, user_id)
+        job_id = enqueue_ingestion_job(file_id, user_id, file_path)
+    except Exception as e:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        logging.error(f"Error queueing upload {file.filename}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to queue document for indexing")
+
+    ingestion_worker.notify()
+    return {"message": f"File {file.filename} queued for indexing", "file_id": file_id, "job_id": job_id, "status": "queued"}
+
+@app.post("/bulk-ingest")
+def bulk_ingest_documents(files: List[UploadFile] = File(...), user_id: int = Form(...)):
+    """Queue many documents for one bulk run; each file's status is at /documents/{id}/status"""
+    unsupported = [file.filename for file in files if not file.filename.lower().endswith(SUPPORTED_EXTENSIONS)]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Unsupported files: {', '.join(unsupported)}. Allowed types are: {', '.join(SUPPORTED_EXTENSIONS)}")
+
+    batch_dir = os.path.join(UPLOAD_DIR, str(uuid.uuid4()))
+    os.makedirs(batch_dir, exist_ok=True)
+    paths = []
+    for file in files:
+        file_path = os.path.abspath(os.path.join(batch_dir, f"{uuid.uuid4()}{os.path.splitext(file.filename)[1].lower()}"))
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        paths.append(file_path)
+
+    registered = register_files(paths, user_id, [file.filename for file in files])
+    submit_bulk_ingest(registered, user_id)
+    return {
+        "message": f"{len(registered)} files queued for bulk indexing",
+        "documents": [{"file_id": file["file_id"], "job_id": file["job_id"], "filename": file["filename"]} for file in registered]
+    }
+
+@app.get("/documents/{file_id}/status", response_model=DocumentStatus)
+def document_status(file_id: int, user_id: int):
+    """Indexing status of an uploaded document"""
+    job = get_document_ingestion_job(file_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return DocumentStatus(
+        document_id=file_id,
+        job_id=job["id"],
+        status=job["status"],
+        chunks=job["chunks"],
+        error=job["error"],
+        created_at=job["created_at"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"]
+    )
 
 @app.post("/register")
 def register(user:UserRegister):
@@ -121,10 +255,44 @@ async def reset_password(request: UserRegister):
     else:
         raise HTTPException(status_code=404, detail="User not found")
 
+@app.get("/users/{user_id}/sessions", response_model=SessionPage)
+def list_user_sessions(user_id: int, limit: int = Query(20, ge=1, le=100), cursor: str = None):
+    """A page of the user's sessions, most recently active first; pass next_cursor to continue"""
+    try:
+        sessions, next_cursor = get_user_sessions(user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SessionPage(sessions=sessions, next_cursor=next_cursor)
+
+@app.get("/users/{user_id}/sessions/{session_id}/history", response_model=HistoryPage)
+def session_history(user_id: int, session_id: str, limit: int = Query(50, ge=1, le=500), cursor: str = None):
+    """A page of one session's turns, oldest first; pass next_cursor to continue"""
+    try:
+        turns, next_cursor = get_session_history(user_id, session_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return HistoryPage(session_id=session_id, turns=turns, next_cursor=next_cursor)
+
+@app.get("/users/{user_id}/history/export")
+def export_user_history(user_id: int):
+    """Stream every turn of the user as newline-delimited JSON, grouped by session"""
+    def rows():
+        for row in iter_user_chat_history(user_id):
+            yield json.dumps(row) + "\n"
+
+    return StreamingResponse(
+        rows(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename=chat_history_{user_id}.ndjson"}
+    )
+
 @app.delete("/chat/history")
 def delete_all_chat_history():
     """Delete all chat history"""
+    # Queued turns would otherwise be written after the delete
+    log_writer.flush()
     success = delete_chat_history()
+    history_cache.invalidate()
     if success:
         return {"message": "All chat history deleted successfully"}
     raise HTTPException(status_code=500, detail="Failed to delete chat history")
@@ -132,7 +300,25 @@ def delete_all_chat_history():
 @app.delete("/chat/history/{session_id}")
 def delete_session_chat_history(session_id: str):
     """Delete chat history for a specific session"""
+    log_writer.flush()
     success = delete_chat_history(session_id)
+    history_cache.invalidate(session_id)
     if success:
         return {"message": f"Chat history for session {session_id} deleted successfully"}
-    raise HTTPException(status_code=500, detail="Failed to delete chat history")
\ No newline at end of file
+    raise HTTPException(status_code=500, detail="Failed to delete chat history")
+
+@app.get("/logs/stats")
+def log_stats():
+    """Queue depth and write/drop counters of the chat log writer"""
+    return log_writer.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters for the retrieval caches"""
+    return {
+        "pages": page_cache.stats(),
+        "searches": search_cache.stats(),
+        "answers": answer_cache.stats(),
+        "embeddings": embedding_cache.stats(),
+        "history": history_cache.stats()
+    }
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from enum import Enum
 from datetime import datetime
+from typing import Optional, List, Dict
 
 class ModelName(str, Enum):
     GPT4_O = "gpt-4o"
@@ -9,13 +10,17 @@ class ModelName(str, Enum):
 class QueryInput(BaseModel):
     question: str
     session_id: str = Field(default=None)
-    # user_id: int
+    user_id: Optional[int] = None
     model: ModelName = Field(default=ModelName.GPT4_O_MINI)
 
 class QueryResponse(BaseModel):
     answer: str
     session_id: str
     model: ModelName 
+    # Which retrieval path supplied the context: "hybrid", "vector_store",
+    # "web_search" or "semantic_cache"
+    retrieval_source: Optional[str] = None
+    sources: List[Dict[str, str]] = Field(default_factory=list)
     # user_id : int
 
 class DocumentInfo(BaseModel):
@@ -26,6 +31,40 @@ class DocumentInfo(BaseModel):
     file_size: int  = None
     content_type: str = None
 
+class DocumentStatus(BaseModel):
+    document_id: int
+    job_id: int
+    # "queued", "running", "done" or "failed"
+    status: str
+    chunks: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class SessionSummary(BaseModel):
+    session_id: str
+    model: Optional[str] = None
+    turns: int
+    started_at: datetime
+    last_at: datetime
+
+class SessionPage(BaseModel):
+    sessions: List[SessionSummary]
+    next_cursor: Optional[str] = None
+
+class HistoryTurn(BaseModel):
+    id: int
+    user_query: str
+    gpt_response: str
+    model: Optional[str] = None
+    created_at: datetime
+
+class HistoryPage(BaseModel):
+    session_id: str
+    turns: List[HistoryTurn]
+    next_cursor: Optional[str] = None
+
 class DeleteFileRequest(BaseModel):
     file_id: int
     user_id:int
@@ -0,0 +1,239 @@
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from .search_cache import STOPWORDS
+
+# Identifiers such as N/record, record.create or custbody_approval are kept as
+# one token and also split into their parts so partial matches still score
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[./][a-z0-9_]+)*")
+PART_PATTERN = re.compile(r"[./]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "." in token or "/" in token:
+            tokens.extend(part for part in PART_PATTERN.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over chunk ids.
+
+    Postings are compact ``array`` pairs of (internal doc number, term
+    frequency). Deleting or replacing a chunk only tombstones its doc number;
+    document frequencies count live chunks only, and the postings are
+    compacted once tombstones pass ``compact_ratio`` of the index.
+
+    The index is written by the indexer and read by the API process, so
+    searches reload it whenever the file on disk has changed since it was
+    last loaded or saved here.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, compact_ratio: float = 0.25):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self.file_version = None     # (mtime, size) of the file the index was last loaded from or saved to
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.doc_ids = []            # doc number -> chunk id, None once deleted
+            self.id_to_doc = {}          # chunk id -> doc number
+            self.doc_len = array('I')
+            self.alive = array('B')      # 1 while the doc number is live, 0 once tombstoned
+            self.postings = {}           # term -> (array('I') doc numbers, array('H') term frequencies)
+            self.total_len = 0
+            self.deleted = 0
+
+    def __len__(self) -> int:
+        return len(self.id_to_doc)
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]):
+        """Add or replace chunks."""
+        with self.lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self.id_to_doc:
+                    self._tombstone(chunk_id)
+                doc = len(self.doc_ids)
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                self.doc_ids.append(chunk_id)
+                self.id_to_doc[chunk_id] = doc
+                self.doc_len.append(length)
+                self.alive.append(1)
+                self.total_len += length
+                for term, tf in terms.items():
+                    docs, tfs = self.postings.setdefault(term, (array('I'), array('H')))
+                    docs.append(doc)
+                    tfs.append(min(tf, 65535))
+            self._compact_if_needed()
+
+    def delete(self, ids: Iterable[str]):
+        with self.lock:
+            for chunk_id in ids:
+                if chunk_id in self.id_to_doc:
+                    self._tombstone(chunk_id)
+            self._compact_if_needed()
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float, float]]:
+        """
+        Rank chunks against the query.
+
+        Returns (chunk id, BM25 score, fraction of query terms the chunk contains)
+        for the top ``k`` chunks.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        self.reload_if_changed()
+        with self.lock:
+            if not terms or not self.id_to_doc:
+                return []
+            n_docs = len(self.id_to_doc)
+            avg_len = self.total_len / n_docs
+            doc_len = np.frombuffer(self.doc_len, dtype=np.uint32).astype(np.float32)
+            alive = np.frombuffer(self.alive, dtype=np.uint8)
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+            matched = np.zeros(len(self.doc_ids), dtype=np.uint16)
+
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                docs = np.frombuffer(posting[0], dtype=np.uint32)
+                tfs = np.frombuffer(posting[1], dtype=np.uint16).astype(np.float32)
+                # Tombstoned chunks stay in the posting list until compaction but must not count
+                df = int(np.count_nonzero(alive[docs]))
+                if not df:
+                    continue
+                idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * doc_len[docs] / avg_len)
+                # Doc numbers are unique within one posting list, so plain fancy indexing is safe
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+                matched[docs] += 1
+
+            scores *= alive
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+
+            return [
+                (self.doc_ids[doc], float(scores[doc]), float(matched[doc]) / len(terms))
+                for doc in candidates
+            ]
+
+    def compact(self):
+        """Drop tombstoned doc numbers from every posting list and renumber."""
+        with self.lock:
+            remap = np.full(len(self.doc_ids), -1, dtype=np.int64)
+            alive = [doc for doc, chunk_id in enumerate(self.doc_ids) if chunk_id is not None]
+            remap[alive] = np.arange(len(alive))
+
+            postings = {}
+            for term, (docs, tfs) in self.postings.items():
+                docs_np = np.frombuffer(docs, dtype=np.uint32)
+                keep = remap[docs_np] >= 0
+                if not keep.any():
+                    continue
+                postings[term] = (
+                    array('I', remap[docs_np[keep]].astype(np.uint32).tobytes()),
+                    array('H', np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes())
+                )
+
+            self.doc_ids = [self.doc_ids[doc] for doc in alive]
+            self.id_to_doc = {chunk_id: doc for doc, chunk_id in enumerate(self.doc_ids)}
+            self.doc_len = array('I', (self.doc_len[doc] for doc in alive))
+            self.alive = array('B', [1]) * len(alive)
+            self.postings = postings
+            self.deleted = 0
+
+    def save(self):
+        """Persist the index atomically next to the Chroma collection."""
+        with self.lock:
+            state = {
+                "doc_ids": self.doc_ids,
+                "doc_len": self.doc_len,
+                "alive": self.alive,
+                "postings": self.postings,
+                "total_len": self.total_len,
+                "deleted": self.deleted,
+            }
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self.file_version = self._file_version()
+
+    def load(self) -> bool:
+        version = self._file_version()
+        if version is None:
+            return False
+        # Unpickle outside the lock so searches keep using the old index meanwhile
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        with self.lock:
+            self.file_version = version
+            self.doc_ids = state["doc_ids"]
+            self.doc_len = state["doc_len"]
+            self.alive = state["alive"]
+            self.postings = state["postings"]
+            self.total_len = state["total_len"]
+            self.deleted = state["deleted"]
+            self.id_to_doc = {chunk_id: doc for doc, chunk_id in enumerate(self.doc_ids) if chunk_id is not None}
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """Load the index again if another process has rewritten the file. Returns whether it did."""
+        version = self._file_version()
+        if version is None or version == self.file_version:
+            return False
+        try:
+            return self.load()
+        except Exception as e:
+            # The file may be mid-replace on some filesystems; keep serving the current index
+            print(f"Error reloading BM25 index: {str(e)}")
+            return False
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _compact_if_needed(self):
+        if self.doc_ids and self.deleted / len(self.doc_ids) > self.compact_ratio:
+            self.compact()
+
+    def _tombstone(self, chunk_id: str):
+        doc = self.id_to_doc.pop(chunk_id)
+        self.doc_ids[doc] = None
+        self.alive[doc] = 0
+        self.total_len -= self.doc_len[doc]
+        self.deleted += 1
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuse several ranked id lists; ids ranked high in any list float to the top."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,254 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from .document_loader import SUPPORTED_EXTENSIONS, init_parser, parse_file
+
+# Parser processes; parsing is CPU-bound, so one per core by default
+BULK_PARSE_WORKERS = int(os.getenv("BULK_PARSE_WORKERS", str(os.cpu_count() or 2)))
+# Chunks a parser sends back per message; bounds what is in flight from each file
+BULK_CHUNK_SLICE = int(os.getenv("BULK_CHUNK_SLICE", "256"))
+
+# Bulk runs share one embedding budget, so they are run one at a time
+bulk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-ingest")
+
+
+def collect_files(paths: List[str]) -> List[str]:
+    """Expand directories into the supported files below them."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith(SUPPORTED_EXTENSIONS))
+        elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+            files.append(path)
+        else:
+            print(f"Skipping unsupported file: {path}")
+    return [os.path.abspath(path) for path in files]
+
+
+def register_files(paths: List[str], user_id: int, filenames: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Create a document record and an ingestion job for each file.
+
+    Jobs are created ``running`` and leased to this process so the
+    single-file queue workers leave them to the bulk run. If the process dies
+    mid-run the leases lapse and those workers finish the jobs instead.
+    """
+    from .database import insert_document_record, enqueue_ingestion_job
+    from .ingestion_queue import INGEST_LEASE_SECONDS, lease_heartbeat, lease_owner
+
+    # Keeps the leases alive for the whole run, including from the command line
+    lease_heartbeat.start()
+
+    files = []
+    for i, path in enumerate(paths):
+        filename = filenames[i] if filenames else os.path.basename(path)
+        file_id = insert_document_record(filename, user_id)
+        job_id = enqueue_ingestion_job(file_id, user_id, path, status='running',
+                                       owner=lease_owner(), lease_seconds=INGEST_LEASE_SECONDS)
+        files.append({"path": path, "filename": filename, "file_id": file_id, "job_id": job_id})
+    return files
+
+
+def run_bulk_ingest(files: List[Dict], user_id: int, workers: int = BULK_PARSE_WORKERS) -> Dict:
+    """
+    Parse files across a process pool and feed every chunk to one embedding pipeline.
+
+    Parsers stream each file's chunks back in slices of BULK_CHUNK_SLICE
+    through a bounded queue, so neither side holds a whole large file. A file
+    that fails to parse is marked failed without affecting the others, and
+    any of its chunks already stored are removed. Each file's job is marked
+    done once its last chunk has been written. Returns a throughput report.
+    """
+    # Imported here rather than at module level: spawned parser processes
+    # re-import this module and must not open Chroma or the database
+    from .database import finish_ingestion_job
+    from .embedding_pipeline import EmbeddingPipeline, chroma_writer
+    from .ingestion_queue import discard_upload, lease_owner
+    from .vector_store_db import vectorstore, embedding_function, delete_document_chunks
+
+    owner = lease_owner()
+    start = time.monotonic()
+    report = {"files": len(files), "succeeded": 0, "failed": 0, "chunks": 0,
+              "workers": workers, "parse_cpu_seconds": 0.0, "errors": {}}
+    remaining: Dict[int, int] = {}
+    finished = set()
+    # Files that failed to parse after some of their chunks were sent on
+    partial = []
+
+    def finish(file: Dict, error: Optional[str] = None):
+        finished.add(file["file_id"])
+        if error:
+            report["failed"] += 1
+            report["errors"][file["filename"]] = error
+            print(f"Failed to ingest {file['filename']}: {error}")
+            recorded = finish_ingestion_job(file["job_id"], 'failed', chunks=0, error=error, owner=owner)
+        else:
+            report["succeeded"] += 1
+            recorded = finish_ingestion_job(file["job_id"], 'done', chunks=file["chunks"], owner=owner)
+        # Not recorded means the lease lapsed and a queue worker has the file now
+        if recorded:
+            discard_upload(file["path"])
+
+    by_id = {file["file_id"]: file for file in files}
+    store = chroma_writer(vectorstore)
+
+    def write(batch: List[Dict], vectors: List[List[float]]):
+        # Chunks of files that have since failed to parse are dropped
+        keep = [i for i, item in enumerate(batch) if item["metadata"]["file_id"] not in finished]
+        if keep:
+            store([batch[i] for i in keep], [vectors[i] for i in keep])
+        for i in keep:
+            file = by_id[batch[i]["metadata"]["file_id"]]
+            remaining[file["file_id"]] -= 1
+            if file["parsed"] and remaining[file["file_id"]] == 0:
+                finish(file)
+
+    def parse_failed(file: Dict, error: str):
+        report["chunks"] -= file["chunks"]
+        if file["chunks"]:
+            partial.append(file)
+        finish(file, error)
+
+    def items() -> Iterator[Dict]:
+        # Spawned rather than forked: the parent holds Chroma, SQLite and HTTP
+        # clients that must not be shared with children
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue(maxsize=workers * 2)
+        cancelled = context.Event()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=init_parser, initargs=(results, cancelled)) as pool:
+            pending = iter(files)
+            in_flight = {}
+            try:
+                while True:
+                    while len(in_flight) < workers:
+                        file = next(pending, None)
+                        if file is None:
+                            break
+                        file.update(chunks=0, parsed=False)
+                        remaining[file["file_id"]] = 0
+                        try:
+                            future = pool.submit(parse_file, file["file_id"], file["path"], BULK_CHUNK_SLICE)
+                        except Exception as e:
+                            # The pool is broken once a parser process has died
+                            parse_failed(file, f"{type(e).__name__}: {str(e)}")
+                            continue
+                        in_flight[file["file_id"]] = (future, file)
+                    if not in_flight:
+                        break
+
+                    try:
+                        message = results.get(timeout=1.0)
+                    except queue.Empty:
+                        # A parser process that died never sends its "done" message
+                        for file_id, (future, file) in list(in_flight.items()):
+                            if future.done() and future.exception() is not None:
+                                del in_flight[file_id]
+                                e = future.exception()
+                                parse_failed(file, f"{type(e).__name__}: {str(e)}")
+                        continue
+
+                    kind, file_id = message[0], message[1]
+                    if file_id not in in_flight:
+                        continue
+                    file = in_flight[file_id][1]
+                    if kind == "chunks":
+                        # Counted before yielding: the embedder may write them before this generator resumes
+                        file["chunks"] += len(message[2])
+                        report["chunks"] += len(message[2])
+                        remaining[file_id] += len(message[2])
+                        for chunk in message[2]:
+                            chunk["metadata"]["file_id"] = file_id
+                            chunk["metadata"]["user_id"] = user_id
+                            yield {"id": str(uuid.uuid4()), "text": chunk["text"], "metadata": chunk["metadata"]}
+                        continue
+
+                    _, _, error, cpu_seconds = message
+                    del in_flight[file_id]
+                    report["parse_cpu_seconds"] += cpu_seconds
+                    if error:
+                        parse_failed(file, error)
+                    else:
+                        file["parsed"] = True
+                        if remaining[file_id] == 0:
+                            finish(file)
+            finally:
+                # Stop parsers that are still running and unblock any waiting on the full queue
+                cancelled.set()
+                while any(not future.done() for future, _ in in_flight.values()):
+                    try:
+                        results.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+
+    try:
+        stats = EmbeddingPipeline(embedding_function, write, label="bulk").run(items())
+        report["embedded"] = stats["chunks"]
+    except Exception as e:
+        # The embedding stage is shared; files it had not finished fail together
+        print(f"Bulk ingest aborted: {str(e)}")
+        for file in files:
+            if file["file_id"] not in finished:
+                try:
+                    delete_document_chunks(file["file_id"], user_id)
+                except Exception as cleanup_error:
+                    print(f"Error removing partial chunks for {file['filename']}: {str(cleanup_error)}")
+                finish(file, f"Embedding failed: {str(e)}")
+
+    for file in partial:
+        try:
+            delete_document_chunks(file["file_id"], user_id)
+        except Exception as cleanup_error:
+            print(f"Error removing partial chunks for {file['filename']}: {str(cleanup_error)}")
+
+    elapsed = time.monotonic() - start
+    report["seconds"] = round(elapsed, 2)
+    report["parse_cpu_seconds"] = round(report["parse_cpu_seconds"], 2)
+    report["files_per_second"] = round(len(files) / elapsed, 2) if elapsed else 0.0
+    report["chunks_per_second"] = round(report["chunks"] / elapsed, 1) if elapsed else 0.0
+    # Average number of cores kept busy parsing
+    report["parse_parallelism"] = round(report["parse_cpu_seconds"] / elapsed, 2) if elapsed else 0.0
+    print(f"Bulk ingest: {report['succeeded']}/{report['files']} files, {report['chunks']} chunks in "
+          f"{report['seconds']}s ({report['files_per_second']} files/s, {report['chunks_per_second']} chunks/s, "
+          f"{report['parse_parallelism']} cores parsing)")
+    return report
+
+
+def bulk_ingest(paths: List[str], user_id: int, workers: int = BULK_PARSE_WORKERS) -> Dict:
+    """Ingest every supported file under ``paths`` for ``user_id``."""
+    files = register_files(collect_files(paths), user_id)
+    return run_bulk_ingest(files, user_id, workers)
+
+
+def submit_bulk_ingest(files: List[Dict], user_id: int, workers: int = BULK_PARSE_WORKERS):
+    """Run an already registered batch in the background."""
+    def run():
+        try:
+            run_bulk_ingest(files, user_id, workers)
+        except Exception as e:
+            print(f"Error running bulk ingest: {str(e)}")
+    return bulk_executor.submit(run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest documents into the vector store")
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    parser.add_argument("--user-id", type=int, required=True, help="Owner of the ingested documents")
+    parser.add_argument("--workers", type=int, default=BULK_PARSE_WORKERS, help="Parser processes")
+    args = parser.parse_args()
+
+    report = bulk_ingest(args.paths, args.user_id, args.workers)
+    for filename, error in report["errors"].items():
+        print(f"  {filename}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+# Ids of the NetSuite documentation chunks in Chroma. Kept free of Chroma and
+# OpenAI imports so the id rules can be used and tested on their own.
+
+# sha256(url)[:32] followed by the chunk's index within the page
+CHUNK_ID_PATTERN = re.compile(r"[0-9a-f]{32}-\d+")
+
+
+def content_hash(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def chunk_id_for(url: str, chunk_index: int) -> str:
+    """Stable Chroma id for the chunk at ``chunk_index`` of a page."""
+    return f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]}-{chunk_index}"
+
+
+def is_legacy_doc_chunk(chunk_id: str, metadata: Optional[Dict]) -> bool:
+    """
+    Whether a chunk is documentation indexed before chunk ids were derived from the URL.
+
+    Those chunks have random ids and, from the earliest indexer, only ``title``
+    and ``url`` metadata. Uploaded documents carry a ``file_id`` and are never
+    matched.
+    """
+    metadata = metadata or {}
+    return "url" in metadata and "file_id" not in metadata and not CHUNK_ID_PATTERN.fullmatch(chunk_id)
+
+
+def legacy_doc_chunk_ids(store, batch_size: int = 5000) -> List[str]:
+    """
+    Ids of the legacy documentation chunks in a Chroma store.
+
+    Chroma filters cannot test whether a metadata key exists, so the metadata
+    of every chunk is read, ``batch_size`` at a time.
+    """
+    legacy = []
+    offset = 0
+    while True:
+        batch = store.get(include=["metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return legacy
+        legacy.extend(chunk_id for chunk_id, metadata in zip(batch["ids"], batch["metadatas"])
+                      if is_legacy_doc_chunk(chunk_id, metadata))
+        offset += len(batch["ids"])
@@ -0,0 +1,97 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .bm25_index import tokenize
+from .embedding_pipeline import estimate_tokens
+
+# Most tokens of retrieved context sent with each question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Characters per scored chunk; pages are cut into chunks this size before ranking
+CONTEXT_CHUNK_SIZE = int(os.getenv("CONTEXT_CHUNK_SIZE", "800"))
+# Chunks sharing at least this much of their word trigrams with a kept chunk are dropped
+CONTEXT_DUPLICATE_OVERLAP = float(os.getenv("CONTEXT_DUPLICATE_OVERLAP", "0.8"))
+
+context_splitter = RecursiveCharacterTextSplitter(chunk_size=CONTEXT_CHUNK_SIZE, chunk_overlap=0, length_function=len)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def split_documents(docs: List[Document]) -> List[Dict]:
+    """Cut every page into chunks, remembering which page and position each came from."""
+    chunks = []
+    for rank, doc in enumerate(docs):
+        for position, text in enumerate(context_splitter.split_text(doc.page_content or "")):
+            text = text.strip()
+            if text:
+                chunks.append({"text": text, "rank": rank, "position": position, "tokens": tokenize(text)})
+    return chunks
+
+
+def score_chunks(chunks: List[Dict], query: str, k1: float = 1.5, b: float = 0.75):
+    """BM25 over just the retrieved chunks, so idf reflects what was actually retrieved."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    n_chunks = len(chunks)
+    avg_len = sum(len(chunk["tokens"]) for chunk in chunks) / n_chunks or 1.0
+    df = Counter(term for chunk in chunks for term in set(chunk["tokens"]) if term in terms)
+    for chunk in chunks:
+        tf = Counter(chunk["tokens"])
+        norm = k1 * (1 - b + b * len(chunk["tokens"]) / avg_len)
+        chunk["score"] = sum(
+            math.log(1 + (n_chunks - df[term] + 0.5) / (df[term] + 0.5)) * tf[term] * (k1 + 1) / (tf[term] + norm)
+            for term in terms if tf[term]
+        )
+
+
+def shingles(tokens: List[str]) -> set:
+    if len(tokens) < 3:
+        return {tuple(tokens)}
+    return {tuple(tokens[i:i + 3]) for i in range(len(tokens) - 2)}
+
+
+def is_duplicate(chunk_shingles: set, kept: List[set]) -> bool:
+    for other in kept:
+        smaller = min(len(chunk_shingles), len(other)) or 1
+        if len(chunk_shingles & other) / smaller >= CONTEXT_DUPLICATE_OVERLAP:
+            return True
+    return False
+
+
+def build_context(docs: List[Document], query: str, budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, Dict]:
+    """
+    Pack the chunks of ``docs`` that best match ``query`` into ``budget`` tokens.
+
+    Chunks are ranked by BM25 score, ties going to the higher-ranked page,
+    and near-duplicates of an already kept chunk are skipped. The kept chunks
+    are joined in reading order. Returns the context and packing stats.
+    """
+    chunks = split_documents(docs)
+    stats = {"pages": len(docs), "chunks": len(chunks), "kept": 0, "duplicates": 0, "tokens": 0, "budget": budget}
+    if not chunks:
+        return "", stats
+    score_chunks(chunks, query)
+
+    kept, kept_shingles, seen = [], [], set()
+    for chunk in sorted(chunks, key=lambda c: (-c["score"], c["rank"], c["position"])):
+        normalized = WHITESPACE.sub(" ", chunk["text"].lower())
+        chunk_shingles = shingles(chunk["tokens"])
+        if normalized in seen or is_duplicate(chunk_shingles, kept_shingles):
+            stats["duplicates"] += 1
+            continue
+        tokens = estimate_tokens(chunk["text"])
+        # A smaller, lower-scored chunk may still fit after a large one does not
+        if stats["tokens"] + tokens > budget:
+            continue
+        seen.add(normalized)
+        kept_shingles.append(chunk_shingles)
+        kept.append(chunk)
+        stats["tokens"] += tokens
+
+    kept.sort(key=lambda c: (c["rank"], c["position"]))
+    stats["kept"] = len(kept)
+    return "\n\n".join(chunk["text"] for chunk in kept), stats
@@ -1,17 +1,99 @@
 from http.client import HTTPException
 import sqlite3
-from datetime import datetime
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
 DB_NAME = "rag_app.db"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# Milliseconds a writer waits for the lock before raising "database is locked"
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))
+# Page cache per connection, in KiB
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "16384"))
+# Prepared statements kept per connection
+DB_CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "256"))
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
 
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections shared across threads.
 
-def create_application_logs():
-    conn = get_db_connection()
+    Connections are opened lazily in WAL mode, so readers never block the
+    writer and commits only fsync at checkpoints. Each connection keeps its
+    own prepared-statement cache, which survives between calls because the
+    connection does.
+    """
+
+    def __init__(self, db_path: str, size: int = DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT / 1000, check_same_thread=False,
+                               cached_statements=DB_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                try:
+                    return self.connect()
+                except Exception:
+                    self.opened -= 1
+                    raise
+        return self.idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        # Never hand the next caller a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self.lock:
+            while True:
+                try:
+                    self.idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self.opened = 0
+
+
+pool = ConnectionPool(DB_NAME)
+
+def db_connection():
+    """Borrow a pooled connection: ``with db_connection() as conn: ...``"""
+    return pool.connection()
+
+
+def create_application_logs(conn):
     conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
                      session_id TEXT,
@@ -19,35 +101,156 @@ def create_application_logs():
                      gpt_response TEXT,
                      model TEXT,
                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
-
-def create_document_store():
-    conn = get_db_connection()
-
 
+def create_document_store(conn):
     conn.execute('''CREATE TABLE IF NOT EXISTS document_store
                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
                      filename TEXT,
                      user_id INTEGER,
                      upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE )''')
-    conn.close()
 
-def create_users_table():
-    conn = get_db_connection()
+def create_users_table(conn):
     conn.execute('''CREATE TABLE IF NOT EXISTS users
                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
                      email TEXT UNIQUE NOT NULL,
                      hashed_password TEXT NOT NULL)''')
-    conn.close()
 
+def create_index_metadata(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS index_metadata
+                    (key TEXT PRIMARY KEY,
+                     value TEXT)''')
+
+def create_index_tracking(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS indexed_pages
+                    (url TEXT PRIMARY KEY,
+                     page_hash TEXT,
+                     indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS indexed_chunks
+                    (chunk_id TEXT PRIMARY KEY,
+                     url TEXT,
+                     chunk_index INTEGER,
+                     content_hash TEXT)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_indexed_chunks_url ON indexed_chunks (url)')
+
+def create_ingestion_jobs(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS ingestion_jobs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     file_id INTEGER,
+                     user_id INTEGER,
+                     file_path TEXT,
+                     status TEXT DEFAULT 'queued',
+                     chunks INTEGER DEFAULT 0,
+                     attempts INTEGER DEFAULT 0,
+                     error TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     started_at TIMESTAMP,
+                     finished_at TIMESTAMP)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs (status, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_file ON ingestion_jobs (file_id)')
+
+def add_log_user_and_history_indexes(conn):
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(application_logs)')]
+    if 'user_id' not in columns:
+        conn.execute('ALTER TABLE application_logs ADD COLUMN user_id INTEGER')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_application_logs_session ON application_logs (session_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_application_logs_user_session ON application_logs (user_id, session_id, created_at)')
+    # get_chat_history without a session reads the latest turns overall
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_application_logs_created ON application_logs (created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_document_store_user ON document_store (user_id, upload_timestamp)')
+
+def add_ingestion_job_leases(conn):
+    # A running job belongs to the process holding its lease; it is only
+    # requeued once the lease lapses without a heartbeat
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(ingestion_jobs)')]
+    if 'owner' not in columns:
+        conn.execute('ALTER TABLE ingestion_jobs ADD COLUMN owner TEXT')
+    if 'lease_expires_at' not in columns:
+        conn.execute('ALTER TABLE ingestion_jobs ADD COLUMN lease_expires_at REAL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_owner ON ingestion_jobs (owner, status)')
+
+def add_chat_sessions(conn):
+    # One row per user session, kept up to date as turns are logged, so the
+    # session list pages through an index instead of grouping every log row
+    conn.execute('''CREATE TABLE IF NOT EXISTS chat_sessions
+                    (user_id INTEGER NOT NULL,
+                     session_id TEXT NOT NULL,
+                     started_at TIMESTAMP,
+                     last_at TIMESTAMP,
+                     turns INTEGER DEFAULT 0,
+                     model TEXT,
+                     PRIMARY KEY (user_id, session_id))''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_sessions_recent ON chat_sessions (user_id, last_at, session_id)')
+    conn.execute('''INSERT OR IGNORE INTO chat_sessions (user_id, session_id, started_at, last_at, turns, model)
+                    SELECT user_id, session_id, MIN(created_at), MAX(created_at), COUNT(*),
+                           (SELECT model FROM application_logs latest
+                            WHERE latest.user_id = logs.user_id AND latest.session_id = logs.session_id
+                            ORDER BY created_at DESC, id DESC LIMIT 1)
+                    FROM application_logs logs WHERE user_id IS NOT NULL
+                    GROUP BY user_id, session_id''')
+
+
+def create_initial_schema(conn):
+    create_application_logs(conn)
+    create_document_store(conn)
+    create_users_table(conn)
+    create_index_metadata(conn)
+    create_index_tracking(conn)
+    create_ingestion_jobs(conn)
+
+
+# Schema migrations, applied in order. The database's PRAGMA user_version
+# records how many have run; append new steps, never edit applied ones.
+MIGRATIONS = [
+    create_initial_schema,
+    add_log_user_and_history_indexes,
+    add_ingestion_job_leases,
+    add_chat_sessions,
+]
 
-def insert_application_logs(session_id, user_query, gpt_response, model):
-    conn = get_db_connection()
-    conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
-                 (session_id, user_query, gpt_response, model))
-    conn.commit()
-    conn.close()
+def migrate():
+    """Bring the database schema up to date. Returns the resulting schema version."""
+    with db_connection() as conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for target, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            # IMMEDIATE takes the write lock up front, so concurrent processes
+            # starting together apply each step once
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= target:
+                    conn.rollback()
+                    continue
+                step(conn)
+                conn.execute(f'PRAGMA user_version = {target}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"Applied database migration {target}: {step.__name__}")
+        return max(version, len(MIGRATIONS))
+
+
+# Counts a logged turn against its session; SET expressions see the row as it was
+UPSERT_CHAT_SESSION = (
+    'INSERT INTO chat_sessions (user_id, session_id, started_at, last_at, turns, model) VALUES (?, ?, ?, ?, 1, ?) '
+    'ON CONFLICT (user_id, session_id) DO UPDATE SET turns = turns + 1, '
+    'started_at = MIN(started_at, excluded.started_at), last_at = MAX(last_at, excluded.last_at), '
+    'model = CASE WHEN excluded.last_at >= last_at THEN excluded.model ELSE model END'
+)
+
+def insert_application_logs(session_id, user_query, gpt_response, model, user_id=None):
+    created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    insert_application_logs_batch([(session_id, user_query, gpt_response, model, user_id, created_at)])
+
+def insert_application_logs_batch(records):
+    """Insert many log rows in one transaction. ``records`` are (session_id, user_query, gpt_response, model, user_id, created_at)."""
+    with db_connection() as conn:
+        with conn:
+            conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model, user_id, created_at) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', records)
+            conn.executemany(UPSERT_CHAT_SESSION, [(user_id, session_id, created_at, created_at, model)
+                                                   for session_id, _, _, model, user_id, created_at in records
+                                                   if user_id is not None])
 
 # def get_user_chat_history(user_id):
 #     conn = get_db_connection()
@@ -70,150 +273,351 @@ def insert_application_logs(session_id, user_query, gpt_response, model):
 #     return chat_history
 
 def get_chat_history(session_id=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    if session_id:
-        cursor.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at DESC LIMIT 10', (session_id,))
-    else:
-        cursor.execute('SELECT user_query, gpt_response FROM application_logs ORDER BY created_at DESC LIMIT 10')
-    messages = []
-    for row in cursor.fetchall():
-        messages.extend([
-            {"role": "human", "content": row['user_query']},
-            {"role": "ai", "content": row['gpt_response']}
-        ])
-    # Reverse the messages to maintain chronological order
-    messages.reverse()
-    conn.close()
-    return messages
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if session_id:
+            cursor.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at DESC LIMIT 10', (session_id,))
+        else:
+            cursor.execute('SELECT user_query, gpt_response FROM application_logs ORDER BY created_at DESC LIMIT 10')
+        messages = []
+        # Rows come newest first; walk them oldest first so each question precedes its answer
+        for row in reversed(cursor.fetchall()):
+            messages.extend([
+                {"role": "human", "content": row['user_query']},
+                {"role": "ai", "content": row['gpt_response']}
+            ])
+        return messages
+
+def encode_cursor(*values):
+    """Opaque pagination cursor holding the sort key of the last row returned."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
 
 def get_user_chat_history(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get the session details (model and timestamp) for each session
-    cursor.execute('SELECT session_id, model, created_at FROM application_logs WHERE user_id = ? GROUP BY session_id ORDER BY created_at', (user_id,))
+    """Every session of a user with all of its turns, in one indexed pass."""
     sessions = {}
-    for row in cursor.fetchall():
-        session_id = row['session_id']
-        model = row['model']
-        session_timestamp = row['created_at']
-        
-        # Initialize the session in the dictionary if not already initialized
-        if session_id not in sessions:
-            sessions[session_id] = {
-                "model": model,
-                "timestamp": session_timestamp,
-                "queries": []
-            }
-
-    # Fetch the queries and responses for each session
-    cursor.execute('SELECT session_id, user_query, gpt_response, created_at FROM application_logs WHERE user_id = ? ORDER BY created_at', (user_id,))
-    for row in cursor.fetchall():
-        session_id = row['session_id']
-        user_query = row['user_query']
-        gpt_response = row['gpt_response']
-        created_at = row['created_at']
-
-        # Add the query and response to the appropriate session's queries list
-        if session_id in sessions:
-            sessions[session_id]["queries"].append({
-                "query": user_query,
-                "response": gpt_response,
-                "timestamp": created_at
+    with db_connection() as conn:
+        rows = conn.execute('SELECT session_id, model, user_query, gpt_response, created_at FROM application_logs '
+                            'WHERE user_id = ? ORDER BY session_id, created_at, id', (user_id,))
+        for row in rows:
+            session = sessions.get(row['session_id'])
+            if session is None:
+                session = sessions[row['session_id']] = {"model": row['model'], "timestamp": row['created_at'], "queries": []}
+            session["queries"].append({
+                "query": row['user_query'],
+                "response": row['gpt_response'],
+                "timestamp": row['created_at']
             })
+    # Oldest session first
+    return dict(sorted(sessions.items(), key=lambda item: item[1]["timestamp"]))
+
+def get_user_sessions(user_id, limit=20, cursor=None):
+    """
+    One page of a user's sessions, most recently active first.
+
+    Returns (sessions, next_cursor); next_cursor is None on the last page.
+    """
+    params = [user_id]
+    after = ''
+    if cursor:
+        last_at, session_id = decode_cursor(cursor)
+        after = 'AND (last_at, session_id) < (?, ?)'
+        params += [last_at, session_id]
+    params.append(limit + 1)
+    with db_connection() as conn:
+        # Walks idx_chat_sessions_recent backwards from the cursor, so a page costs O(limit)
+        rows = conn.execute(f'SELECT session_id, last_at, turns, model, started_at FROM chat_sessions '
+                            f'WHERE user_id = ? {after} ORDER BY last_at DESC, session_id DESC LIMIT ?', params).fetchall()
+    sessions = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(sessions[-1]['last_at'], sessions[-1]['session_id']) if len(rows) > limit else None
+    return sessions, next_cursor
+
+def get_session_history(user_id, session_id, limit=50, cursor=None):
+    """
+    One page of a session's turns, oldest first.
+
+    Returns (turns, next_cursor); next_cursor is None on the last page.
+    """
+    after = ''
+    params = [user_id, session_id]
+    if cursor:
+        created_at, log_id = decode_cursor(cursor)
+        after = 'AND (created_at, id) > (?, ?)'
+        params += [created_at, log_id]
+    params.append(limit + 1)
+    with db_connection() as conn:
+        rows = conn.execute(f'SELECT id, user_query, gpt_response, model, created_at FROM application_logs '
+                            f'WHERE user_id = ? AND session_id = ? {after} ORDER BY created_at, id LIMIT ?',
+                            params).fetchall()
+    turns = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(turns[-1]['created_at'], turns[-1]['id']) if len(rows) > limit else None
+    return turns, next_cursor
+
+def iter_user_chat_history(user_id, batch_size=500):
+    """
+    Yield every turn of a user, grouped by session, in batches of ``batch_size``.
+
+    Each batch borrows a connection only while it is read, so a slow export
+    neither holds a pooled connection nor the whole history in memory.
+    """
+    last = None
+    while True:
+        with db_connection() as conn:
+            if last is None:
+                rows = conn.execute('SELECT id, session_id, user_query, gpt_response, model, created_at '
+                                    'FROM application_logs WHERE user_id = ? '
+                                    'ORDER BY session_id, created_at, id LIMIT ?', (user_id, batch_size)).fetchall()
+            else:
+                rows = conn.execute('SELECT id, session_id, user_query, gpt_response, model, created_at '
+                                    'FROM application_logs WHERE user_id = ? AND (session_id, created_at, id) > (?, ?, ?) '
+                                    'ORDER BY session_id, created_at, id LIMIT ?', (user_id, *last, batch_size)).fetchall()
+        for row in rows:
+            yield dict(row)
+        if len(rows) < batch_size:
+            return
+        last = (rows[-1]['session_id'], rows[-1]['created_at'], rows[-1]['id'])
 
-    conn.close()
-    
-    # Format the final response in the desired structure
-    formatted_history = {
-        session_id: {
-            "model": session_data["model"],
-            "timestamp": session_data["timestamp"],
-            "queries": session_data["queries"]
-        }
-        for session_id, session_data in sessions.items()
-    }
-    
-    return formatted_history
 def delete_chat_session(user_id,session_id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM application_logs WHERE user_id = ? AND session_id = ?', (user_id,session_id))
-    conn.commit()
-    conn.close()
-    return True
+    with db_connection() as conn:
+        conn.execute('DELETE FROM application_logs WHERE user_id = ? AND session_id = ?', (user_id,session_id))
+        conn.execute('DELETE FROM chat_sessions WHERE user_id = ? AND session_id = ?', (user_id,session_id))
+        conn.commit()
+        return True
 
 def insert_document_record(filename,user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO document_store (filename, user_id) VALUES (?,?)', (filename,user_id))
-    file_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return file_id
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO document_store (filename, user_id) VALUES (?,?)', (filename,user_id))
+        file_id = cursor.lastrowid
+        conn.commit()
+        return file_id
 
 def delete_document_record(file_id,user_id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM document_store WHERE id = ? AND user_id = ?', (file_id,user_id))
-    conn.commit()
-    conn.close()
-    return True
+    with db_connection() as conn:
+        conn.execute('DELETE FROM document_store WHERE id = ? AND user_id = ?', (file_id,user_id))
+        conn.commit()
+        return True
 
 def get_all_documents(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, user_id, filename, upload_timestamp FROM document_store WHERE user_id = ? ORDER BY upload_timestamp DESC', (user_id,))
-    documents = cursor.fetchall()
-    conn.close()
-    return [dict(doc) for doc in documents]
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, user_id, filename, upload_timestamp FROM document_store WHERE user_id = ? ORDER BY upload_timestamp DESC', (user_id,))
+        documents = cursor.fetchall()
+        return [dict(doc) for doc in documents]
 
 
 
 
 
 def insert_user(email: str, hashed_password: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('INSERT INTO users (email, hashed_password) VALUES (?, ?)', (email, hashed_password))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('INSERT INTO users (email, hashed_password) VALUES (?, ?)', (email, hashed_password))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            raise HTTPException(status_code=400, detail="Email already registered")
 
 def get_user_by_email(email: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
+        user = cursor.fetchone()
+        return user
 
 def reset_password_db(email: str, hashed_password: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET hashed_password = ? WHERE email = ?', (hashed_password, email))
-    conn.commit()
-    conn.close()
-    return {"message": "Password reset successfully!"}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE users SET hashed_password = ? WHERE email = ?', (hashed_password, email))
+        conn.commit()
+        return {"message": "Password reset successfully!"}
 
 def delete_chat_history(session_id=None):
-    conn = get_db_connection()
-    try:
-        if session_id:
-            conn.execute('DELETE FROM application_logs WHERE session_id = ?', (session_id,))
-        else:
-            conn.execute('DELETE FROM application_logs')
+    with db_connection() as conn:
+        try:
+            if session_id:
+                conn.execute('DELETE FROM application_logs WHERE session_id = ?', (session_id,))
+                conn.execute('DELETE FROM chat_sessions WHERE session_id = ?', (session_id,))
+            else:
+                conn.execute('DELETE FROM application_logs')
+                conn.execute('DELETE FROM chat_sessions')
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error deleting chat history: {str(e)}")
+            return False
+
+def get_index_generation() -> int:
+    """Current generation of the document index; bumped whenever it is re-indexed."""
+    with db_connection() as conn:
+        row = conn.execute("SELECT value FROM index_metadata WHERE key = 'index_generation'").fetchone()
+        return int(row['value']) if row else 0
+
+def bump_index_generation() -> int:
+    with db_connection() as conn:
+        conn.execute("INSERT INTO index_metadata (key, value) VALUES ('index_generation', '1') "
+                     "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
         conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error deleting chat history: {str(e)}")
-        return False
-    finally:
-        conn.close()
-
-# Initialize the database tables
-create_application_logs()
-create_document_store()
-create_users_table()
+        row = conn.execute("SELECT value FROM index_metadata WHERE key = 'index_generation'").fetchone()
+        return int(row['value'])
+
+def get_index_metadata(key, default=None):
+    with db_connection() as conn:
+        row = conn.execute('SELECT value FROM index_metadata WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else default
+
+def set_index_metadata(key, value):
+    with db_connection() as conn:
+        conn.execute('INSERT INTO index_metadata (key, value) VALUES (?, ?) '
+                     'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, value))
+        conn.commit()
+
+def get_indexed_page_hashes():
+    """Content hash of every indexed documentation page, keyed by URL."""
+    with db_connection() as conn:
+        rows = conn.execute('SELECT url, page_hash FROM indexed_pages').fetchall()
+        return {row['url']: row['page_hash'] for row in rows}
+
+def get_indexed_chunk_hashes(url):
+    with db_connection() as conn:
+        rows = conn.execute('SELECT chunk_id, content_hash FROM indexed_chunks WHERE url = ?', (url,)).fetchall()
+        return {row['chunk_id']: row['content_hash'] for row in rows}
+
+def save_indexed_page(url, page_hash, chunks):
+    """Record a page and its chunks as indexed. ``chunks`` is a list of (chunk_id, chunk_index, content_hash)."""
+    with db_connection() as conn:
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO indexed_pages (url, page_hash) VALUES (?, ?)', (url, page_hash))
+            conn.execute('DELETE FROM indexed_chunks WHERE url = ?', (url,))
+            conn.executemany('INSERT INTO indexed_chunks (chunk_id, url, chunk_index, content_hash) VALUES (?, ?, ?, ?)',
+                             [(chunk_id, url, chunk_index, content_hash) for chunk_id, chunk_index, content_hash in chunks])
+
+def delete_indexed_page(url):
+    """Forget an indexed page and return the ids of its chunks."""
+    with db_connection() as conn:
+        with conn:
+            rows = conn.execute('SELECT chunk_id FROM indexed_chunks WHERE url = ?', (url,)).fetchall()
+            conn.execute('DELETE FROM indexed_chunks WHERE url = ?', (url,))
+            conn.execute('DELETE FROM indexed_pages WHERE url = ?', (url,))
+        return [row['chunk_id'] for row in rows]
+
+def clear_index_tracking():
+    with db_connection() as conn:
+        with conn:
+            conn.execute('DELETE FROM indexed_chunks')
+            conn.execute('DELETE FROM indexed_pages')
+
+def enqueue_ingestion_job(file_id, user_id, file_path, status='queued', owner=None, lease_seconds=None):
+    """
+    Add an ingestion job. Jobs created as ``running`` belong to ``owner`` for
+    ``lease_seconds`` and are left alone by the queue workers meanwhile.
+    """
+    lease_expires_at = time.time() + lease_seconds if status == 'running' and lease_seconds else None
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO ingestion_jobs (file_id, user_id, file_path, status, owner, lease_expires_at, started_at) "
+                       "VALUES (?, ?, ?, ?, ?, ?, CASE WHEN ? = 'running' THEN CURRENT_TIMESTAMP END)",
+                       (file_id, user_id, file_path, status, owner, lease_expires_at, status))
+        job_id = cursor.lastrowid
+        conn.commit()
+        return job_id
+
+def claim_ingestion_job(owner, lease_seconds, max_attempts=None):
+    """
+    Lease the oldest queued job to ``owner`` and return it, or None if the queue is empty.
+
+    A job already tried ``max_attempts`` times, e.g. one whose file kept
+    crashing the worker, is marked failed instead and returned with status
+    ``failed`` so the caller can clean up after it.
+    """
+    with db_connection() as conn:
+        while True:
+            row = conn.execute("SELECT * FROM ingestion_jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            if max_attempts is not None and row['attempts'] >= max_attempts:
+                error = f"Gave up after {row['attempts']} attempts"
+                if row['error']:
+                    error = f"{error}: {row['error']}"
+                cursor = conn.execute("UPDATE ingestion_jobs SET status = 'failed', error = ?, owner = NULL, "
+                                      "lease_expires_at = NULL, finished_at = CURRENT_TIMESTAMP "
+                                      "WHERE id = ? AND status = 'queued'", (error, row['id']))
+                conn.commit()
+                if cursor.rowcount == 1:
+                    return dict(row, status='failed', error=error)
+                continue
+            # Another worker, possibly in another process, may claim the same row first
+            cursor = conn.execute("UPDATE ingestion_jobs SET status = 'running', attempts = attempts + 1, owner = ?, "
+                                  "lease_expires_at = ?, started_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'queued'",
+                                  (owner, time.time() + lease_seconds, row['id']))
+            conn.commit()
+            if cursor.rowcount == 1:
+                return dict(row, status='running', attempts=row['attempts'] + 1, owner=owner)
+
+def update_ingestion_job_progress(job_id, chunks):
+    with db_connection() as conn:
+        conn.execute('UPDATE ingestion_jobs SET chunks = ? WHERE id = ?', (chunks, job_id))
+        conn.commit()
+
+def finish_ingestion_job(job_id, status, chunks=None, error=None, owner=None):
+    """
+    Record a job's outcome. With ``owner``, nothing is written if the job has
+    since been requeued and leased to someone else. Returns whether it was recorded.
+    """
+    with db_connection() as conn:
+        cursor = conn.execute('UPDATE ingestion_jobs SET status = ?, chunks = COALESCE(?, chunks), error = ?, '
+                              'lease_expires_at = NULL, finished_at = CURRENT_TIMESTAMP '
+                              'WHERE id = ? AND (? IS NULL OR owner = ?)', (status, chunks, error, job_id, owner, owner))
+        conn.commit()
+        return cursor.rowcount == 1
+
+def retry_ingestion_job(job_id, error, owner):
+    """
+    Put a job that failed back on the queue, unless it has since been leased
+    to someone else. Returns whether it was requeued.
+    """
+    with db_connection() as conn:
+        cursor = conn.execute("UPDATE ingestion_jobs SET status = 'queued', chunks = 0, error = ?, started_at = NULL, "
+                              "owner = NULL, lease_expires_at = NULL WHERE id = ? AND owner = ?", (error, job_id, owner))
+        conn.commit()
+        return cursor.rowcount == 1
+
+def renew_ingestion_leases(owner, lease_seconds):
+    """Extend the lease on every job ``owner`` is running. Returns how many."""
+    with db_connection() as conn:
+        cursor = conn.execute("UPDATE ingestion_jobs SET lease_expires_at = ? WHERE owner = ? AND status = 'running'",
+                              (time.time() + lease_seconds, owner))
+        conn.commit()
+        return cursor.rowcount
+
+def requeue_expired_ingestion_jobs():
+    """
+    Put running jobs whose owner stopped renewing their lease back on the
+    queue. Jobs from before leases were tracked have none and count as expired.
+    Returns how many.
+    """
+    with db_connection() as conn:
+        cursor = conn.execute("UPDATE ingestion_jobs SET status = 'queued', chunks = 0, started_at = NULL, owner = NULL, "
+                              "lease_expires_at = NULL WHERE status = 'running' "
+                              "AND (lease_expires_at IS NULL OR lease_expires_at < ?)", (time.time(),))
+        conn.commit()
+        return cursor.rowcount
+
+def get_document_ingestion_job(file_id, user_id):
+    """Latest ingestion job for a document."""
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM ingestion_jobs WHERE file_id = ? AND user_id = ? ORDER BY id DESC LIMIT 1',
+                           (file_id, user_id)).fetchone()
+        return dict(row) if row else None
+
+# Create or upgrade the database tables
+migrate()
 
@@ -0,0 +1,141 @@
+import csv
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+from langchain_community.document_loaders import (
+    PyPDFLoader,
+    Docx2txtLoader,
+    UnstructuredHTMLLoader,
+    TextLoader,
+    UnstructuredCSVLoader,
+    UnstructuredExcelLoader)
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Loading and splitting only. Nothing here touches the vector store, so parser
+# processes can import this module without opening Chroma or an API client.
+# Spreadsheet rows grouped into one document before splitting
+INGEST_ROW_BATCH = int(os.getenv("INGEST_ROW_BATCH", "200"))
+
+# File types get_document_loader can parse
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.html', '.txt', '.csv', '.xlsx', '.xls')
+
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
+
+
+def get_document_loader(file_path: str):
+    if file_path.endswith('.pdf'):
+        return PyPDFLoader(file_path)
+    elif file_path.endswith('.docx'):
+        return Docx2txtLoader(file_path)
+    elif file_path.endswith('.html'):
+        return UnstructuredHTMLLoader(file_path)
+    elif file_path.endswith('.txt'):
+        return TextLoader(file_path, encoding='UTF-8')
+    elif file_path.endswith('.csv'):
+        return UnstructuredCSVLoader(file_path,mode="elements")
+    elif file_path.endswith('.xlsx') or file_path.endswith('.xls'):
+        return UnstructuredExcelLoader(file_path,mode="elements")
+    else:
+        raise ValueError(f"Unsupported file type: {file_path}")
+
+
+def load_and_split_document(file_path: str) -> List[Document]:
+    return list(iter_document_splits(file_path))
+
+
+def rows_to_documents(rows: Iterator[tuple], source: str, sheet: Optional[str] = None,
+                      batch_size: int = INGEST_ROW_BATCH) -> Iterator[Document]:
+    """Group spreadsheet rows under their header into one Document per ``batch_size`` rows."""
+    header = None
+    lines, first_row = [], 1
+    for row_number, row in enumerate(rows, start=1):
+        values = ["" if value is None else str(value).strip() for value in row]
+        if not any(values):
+            continue
+        if header is None:
+            header = values
+            first_row = row_number + 1
+            continue
+        lines.append(", ".join(f"{name}: {value}" for name, value in zip(header, values) if value))
+        if len(lines) >= batch_size:
+            yield Document(page_content="\n".join(lines),
+                           metadata={"source": source, "sheet": sheet or "", "rows": f"{first_row}-{row_number}"})
+            lines, first_row = [], row_number + 1
+    if lines:
+        yield Document(page_content="\n".join(lines),
+                       metadata={"source": source, "sheet": sheet or "", "rows": f"{first_row}-{row_number}"})
+
+
+def iter_document_pages(file_path: str) -> Iterator[Document]:
+    """
+    Yield a file's content one page, element or row batch at a time.
+
+    CSV and XLSX files are read row by row (XLSX through openpyxl in read-only
+    mode) so a large spreadsheet is never held in memory in full.
+    """
+    if file_path.endswith('.csv'):
+        with open(file_path, newline='', encoding='utf-8', errors='replace') as f:
+            yield from rows_to_documents(csv.reader(f), file_path)
+    elif file_path.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                yield from rows_to_documents(sheet.iter_rows(values_only=True), file_path, sheet.title)
+        finally:
+            workbook.close()
+    else:
+        yield from get_document_loader(file_path).lazy_load()
+
+
+def iter_document_splits(file_path: str) -> Iterator[Document]:
+    for page in iter_document_pages(file_path):
+        yield from text_splitter.split_documents([page])
+
+
+# Set in each parser process by init_parser
+parse_results = None
+parse_cancelled = None
+
+
+def init_parser(results, cancelled):
+    global parse_results, parse_cancelled
+    parse_results, parse_cancelled = results, cancelled
+    # A parser exiting after a cancelled run must not wait for the parent to read what it sent
+    results.cancel_join_thread()
+
+
+def iter_chunk_slices(file_path: str, slice_size: int) -> Iterator[List[Dict]]:
+    """Split a file into plain chunk dicts, yielded ``slice_size`` at a time."""
+    chunks = []
+    for split in iter_document_splits(file_path):
+        chunks.append({"text": split.page_content, "metadata": split.metadata})
+        if len(chunks) >= slice_size:
+            yield chunks
+            chunks = []
+    if chunks:
+        yield chunks
+
+
+def parse_file(key, file_path: str, slice_size: int):
+    """
+    Stream one file's chunks back to the parent through ``parse_results``.
+
+    Runs in parser processes. Sends ``("chunks", key, slice)`` messages as the
+    file is split, then ``("done", key, error, cpu_seconds)``. The results
+    queue is bounded, so a parser waits for the embedder instead of holding
+    the whole file's chunks. Errors are reported rather than raised, so a file
+    a loader cannot read fails on its own without breaking the batch.
+    """
+    start = time.process_time()
+    error = None
+    try:
+        for chunk_slice in iter_chunk_slices(file_path, slice_size):
+            if parse_cancelled.is_set():
+                return
+            parse_results.put(("chunks", key, chunk_slice))
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)}"
+    parse_results.put(("done", key, error, time.process_time() - start))
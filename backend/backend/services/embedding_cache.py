@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store keyed by (model namespace, SHA-256 of the text).
+
+    Vectors are stored as raw float32 blobs. Once the cache grows past
+    ``max_entries`` the least recently used tenth is evicted.
+    """
+
+    def __init__(self, db_path: str = EMBEDDING_CACHE_DB, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS embeddings
+                             (model TEXT,
+                              text_hash BLOB,
+                              vector BLOB,
+                              last_used REAL,
+                              PRIMARY KEY (model, text_hash)) WITHOUT ROWID''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)')
+        self.conn.commit()
+        self.entries = self.conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def get_many(self, model: str, digests: List[bytes]) -> Dict[bytes, List[float]]:
+        found = {}
+        with self.lock:
+            for digest in digests:
+                row = self.conn.execute('SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?',
+                                        (model, digest)).fetchone()
+                if row is not None:
+                    found[digest] = array('f', row[0]).tolist()
+            if found:
+                now = time.time()
+                self.conn.executemany('UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?',
+                                      [(now, model, digest) for digest in found])
+                self.conn.commit()
+            self.counters["hits"] += len(found)
+            self.counters["misses"] += len(digests) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[bytes, List[float]]):
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.executemany(
+                'INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)',
+                [(model, digest, array('f', vector).tobytes(), now) for digest, vector in vectors.items()]
+            )
+            self.entries += cursor.rowcount
+            self.counters["stores"] += cursor.rowcount
+            if self.entries > self.max_entries:
+                self._evict()
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            hit_rate = self.counters["hits"] / lookups if lookups else 0.0
+            return {**self.counters, "entries": self.entries, "hit_rate": round(hit_rate, 3)}
+
+    def _evict(self):
+        overflow = self.entries - self.max_entries + self.max_entries // 10
+        cursor = self.conn.execute('DELETE FROM embeddings WHERE (model, text_hash) IN '
+                                   '(SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)',
+                                   (overflow,))
+        self.entries -= cursor.rowcount
+        self.counters["evictions"] += cursor.rowcount
+
+
+def cache_namespace(underlying: Embeddings) -> str:
+    """
+    Cache key for the vectors a model produces.
+
+    The same model name served from another endpoint (a local fake or
+    benchmark server) or at another dimension count produces different
+    vectors, so both are part of the key.
+    """
+    namespace = getattr(underlying, "model", type(underlying).__name__)
+    base_url = getattr(underlying, "openai_api_base", None)
+    if base_url:
+        namespace += f"@{base_url}"
+    dimensions = getattr(underlying, "dimensions", None)
+    if dimensions:
+        namespace += f"/{dimensions}"
+    return namespace
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts it has not embedded before to the underlying model."""
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, namespace: Optional[str] = None):
+        self.underlying = underlying
+        self.cache = cache
+        self.model = namespace or cache_namespace(underlying)
+
+    def lookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """The cached vector of each text, or None where it has not been embedded yet."""
+        digests = [text_digest(text) for text in texts]
+        vectors = self.cache.get_many(self.model, list(set(digests)))
+        return [vectors.get(digest) for digest in digests]
+
+    def embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts already known to be missing from the cache and store them."""
+        digests, missing = self._unique(texts)
+        computed = dict(zip(missing.keys(), self.underlying.embed_documents(list(missing.values()))))
+        self.cache.put_many(self.model, computed)
+        return [computed[digest] for digest in digests]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.lookup(texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        if missing:
+            return self._merge(vectors, self.embed_uncached(missing))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def alookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        return await asyncio.to_thread(self.lookup, texts)
+
+    async def aembed_uncached(self, texts: List[str]) -> List[List[float]]:
+        digests, missing = self._unique(texts)
+        computed = dict(zip(missing.keys(), await self.underlying.aembed_documents(list(missing.values()))))
+        await asyncio.to_thread(self.cache.put_many, self.model, computed)
+        return [computed[digest] for digest in digests]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = await self.alookup(texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        if missing:
+            return self._merge(vectors, await self.aembed_uncached(missing))
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def _unique(self, texts: List[str]):
+        # Identical texts within one call are embedded once
+        digests = [text_digest(text) for text in texts]
+        return digests, dict(zip(digests, texts))
+
+    def _merge(self, vectors: List[Optional[List[float]]], computed: List[List[float]]) -> List[List[float]]:
+        computed = iter(computed)
+        return [vector if vector is not None else next(computed) for vector in vectors]
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,182 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from .rate_limit import AdaptiveRateLimiter
+
+# Batches are closed at whichever limit is hit first
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "20000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# Account budget for the embeddings endpoint
+EMBED_RPM = float(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = float(os.getenv("EMBED_TPM", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable_error(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return is_rate_limit_error(error) or (status is not None and status >= 500) or \
+        type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout")
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def chroma_writer(vectorstore) -> Callable[[List[Dict], List[List[float]]], None]:
+    """Writer that upserts precomputed embeddings into a langchain Chroma store."""
+    def write(batch: List[Dict], vectors: List[List[float]]):
+        vectorstore._collection.upsert(
+            ids=[item["id"] for item in batch],
+            embeddings=vectors,
+            documents=[item["text"] for item in batch],
+            metadatas=[item["metadata"] for item in batch]
+        )
+    return write
+
+
+class EmbeddingPipeline:
+    """
+    Embed chunks in token-sized batches, several at a time, under an RPM/TPM budget.
+
+    Items are dicts with ``id``, ``text`` and ``metadata``. Each batch is handed
+    to ``write`` as soon as its embeddings arrive, so a failure late in a large
+    run keeps everything written before it. ``embeddings`` can be any langchain
+    Embeddings, e.g. OpenAIEmbeddings pointed at a local fake server through
+    EMBEDDINGS_BASE_URL.
+    """
+
+    def __init__(self, embeddings: Embeddings, write: Callable[[List[Dict], List[List[float]]], None],
+                 batch_tokens: int = EMBED_BATCH_TOKENS, batch_size: int = EMBED_BATCH_SIZE,
+                 concurrency: int = EMBED_CONCURRENCY, limiter: Optional[AdaptiveRateLimiter] = None,
+                 max_retries: int = EMBED_MAX_RETRIES, report_every: float = 5.0, label: str = "chunks",
+                 on_progress: Optional[Callable[[Dict], None]] = None):
+        self.embeddings = embeddings
+        self.write = write
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.limiter = limiter or embedding_rate_limiter
+        self.max_retries = max_retries
+        self.report_every = report_every
+        self.label = label
+        self.on_progress = on_progress
+
+    def make_batches(self, items: Iterable[Dict]) -> Iterator[List[Dict]]:
+        batch, batch_tokens = [], 0
+        for item in items:
+            tokens = estimate_tokens(item["text"])
+            if batch and (batch_tokens + tokens > self.batch_tokens or len(batch) >= self.batch_size):
+                yield batch
+                batch, batch_tokens = [], 0
+            item["tokens"] = tokens
+            batch.append(item)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def embed_batch(self, batch: List[Dict]) -> List[List[float]]:
+        texts = [item["text"] for item in batch]
+        # With a CachedEmbeddings, only the texts missing from the cache cost API budget
+        lookup = getattr(self.embeddings, "lookup", None)
+        vectors = lookup(texts) if lookup else [None] * len(batch)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+        embed = self.embeddings.embed_uncached if lookup else self.embeddings.embed_documents
+        tokens = sum(batch[i]["tokens"] for i in missing)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            try:
+                for i, vector in zip(missing, embed([texts[i] for i in missing])):
+                    vectors[i] = vector
+                self.limiter.reward()
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                if is_rate_limit_error(e):
+                    self.limiter.penalize()
+                # Exponential backoff with full jitter, unless the server said how long to wait
+                delay = retry_after_seconds(e) or random.uniform(0, min(60, 2 ** attempt))
+                print(f"Embedding batch of {len(batch)} failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, items: Iterable[Dict]) -> Dict:
+        """Embed and write every item. Returns throughput stats."""
+        stats = {"chunks": 0, "batches": 0, "tokens": 0}
+        start = last_report = time.monotonic()
+        batches = self.make_batches(items)
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed") as pool:
+            exhausted = False
+            try:
+                while True:
+                    # Only a couple of batches per worker are ever held in memory
+                    while not exhausted and len(in_flight) < self.concurrency * 2:
+                        batch = next(batches, None)
+                        if batch is None:
+                            exhausted = True
+                            break
+                        in_flight[pool.submit(self.embed_batch, batch)] = batch
+
+                    if not in_flight:
+                        break
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch = in_flight.pop(future)
+                        self.write(batch, future.result())
+                        stats["chunks"] += len(batch)
+                        stats["batches"] += 1
+                        stats["tokens"] += sum(item["tokens"] for item in batch)
+                        if self.on_progress:
+                            self.on_progress(dict(stats))
+
+                    now = time.monotonic()
+                    if now - last_report >= self.report_every:
+                        last_report = now
+                        print(f"[{self.label}] Embedded {stats['chunks']} chunks ({stats['chunks'] / (now - start):.1f} chunks/s)")
+            except Exception:
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+        elapsed = time.monotonic() - start
+        stats["seconds"] = round(elapsed, 2)
+        stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 1) if elapsed else 0.0
+        print(f"[{self.label}] Embedded {stats['chunks']} chunks in {stats['batches']} batches "
+              f"({stats['chunks_per_second']} chunks/s)")
+        return stats
+
+
+# One budget per process, shared by every pipeline hitting the same account
+embedding_rate_limiter = AdaptiveRateLimiter(EMBED_RPM, EMBED_TPM)
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from .database import get_chat_history
+from .log_writer import log_writer
+
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "1000"))
+# Turns kept per session; matches the LIMIT in get_chat_history
+HISTORY_CACHE_TURNS = int(os.getenv("HISTORY_CACHE_TURNS", "10"))
+
+
+class HistoryCache:
+    """
+    Recent turns per session, held as ready-to-use prompt messages.
+
+    Each session is a ring buffer of its last ``turns`` (HumanMessage,
+    AIMessage) pairs; sessions are evicted least recently used. The key
+    ``None`` stands for the latest turns across all sessions, which is what
+    get_chat_history() returns without a session id.
+    """
+
+    def __init__(self, max_sessions: int = HISTORY_CACHE_SESSIONS, turns: int = HISTORY_CACHE_TURNS):
+        self.max_sessions = max_sessions
+        self.turns = turns
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        # key -> [loads in flight, changed since they started]; a load that
+        # raced with a new turn or a delete is returned but not cached
+        self.loading = {}
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, session_id: Optional[str] = None) -> List[BaseMessage]:
+        messages = self._lookup(session_id)
+        if messages is not None:
+            return messages
+        try:
+            history = self._load(session_id)
+        except BaseException:
+            self._abandon(session_id)
+            raise
+        return self._fill(session_id, history)
+
+    async def aget(self, session_id: Optional[str] = None) -> List[BaseMessage]:
+        messages = self._lookup(session_id)
+        if messages is not None:
+            return messages
+        try:
+            history = await asyncio.to_thread(self._load, session_id)
+        except BaseException:
+            self._abandon(session_id)
+            raise
+        return self._fill(session_id, history)
+
+    def append(self, session_id: str, user_query: str, answer: str):
+        """Record a new turn in every cached view it belongs to."""
+        turn = (HumanMessage(content=user_query), AIMessage(content=answer))
+        with self.lock:
+            self._mark_changed([session_id, None])
+            for key in (session_id, None):
+                ring = self.sessions.get(key)
+                # Sessions that are not cached are loaded from the database on their next read
+                if ring is not None:
+                    ring.append(turn)
+
+    def invalidate(self, session_id: Optional[str] = None):
+        """Forget a session after its history is deleted; no session id forgets everything."""
+        with self.lock:
+            if session_id is None:
+                self._mark_changed(list(self.loading))
+                self.sessions.clear()
+            else:
+                self._mark_changed([session_id, None])
+                self.sessions.pop(session_id, None)
+                # The cross-session view may have included the deleted turns
+                self.sessions.pop(None, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {**self.counters, "sessions": len(self.sessions)}
+
+    def _lookup(self, session_id: Optional[str]):
+        with self.lock:
+            ring = self.sessions.get(session_id)
+            if ring is None:
+                self.counters["misses"] += 1
+                self.loading.setdefault(session_id, [0, False])[0] += 1
+                return None
+            self.sessions.move_to_end(session_id)
+            self.counters["hits"] += 1
+            return [message for turn in ring for message in turn]
+
+    def _load(self, session_id: Optional[str]) -> List[Dict]:
+        # Turns still queued in the write-behind logger must be visible to the read
+        log_writer.flush()
+        return get_chat_history(session_id)
+
+    def _mark_changed(self, keys: List[Optional[str]]):
+        for key in keys:
+            if key in self.loading:
+                self.loading[key][1] = True
+
+    def _finish_load(self, session_id: Optional[str]) -> bool:
+        """Release an in-flight load; True if nothing changed while it ran."""
+        state = self.loading[session_id]
+        state[0] -= 1
+        if state[0] == 0:
+            del self.loading[session_id]
+        return not state[1]
+
+    def _abandon(self, session_id: Optional[str]):
+        with self.lock:
+            self._finish_load(session_id)
+
+    def _fill(self, session_id: Optional[str], history: List[Dict]) -> List[BaseMessage]:
+        ring = deque(maxlen=self.turns)
+        for human, ai in zip(history[0::2], history[1::2]):
+            ring.append((HumanMessage(content=human["content"]), AIMessage(content=ai["content"])))
+        with self.lock:
+            if self._finish_load(session_id):
+                self.sessions[session_id] = ring
+                self.sessions.move_to_end(session_id)
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+                    self.counters["evictions"] += 1
+        return [message for turn in ring for message in turn]
+
+
+history_cache = HistoryCache()
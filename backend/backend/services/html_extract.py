@@ -0,0 +1,178 @@
+import os
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urldefrag, urljoin
+
+# HTML-to-text extraction for NetSuite help pages, shared by the live search
+# and the crawler. Each page is parsed once and the title, main content,
+# links and section headings are all read from that one tree.
+#
+# Backends, fastest first: selectolax (lexbor), lxml, then BeautifulSoup's
+# pure-Python html.parser. HTML_PARSER picks one explicitly; "auto" uses the
+# fastest installed. A page the fast backend cannot handle is retried with
+# BeautifulSoup.
+
+HTML_PARSER = os.getenv("HTML_PARSER", "auto")
+
+# Tried in order; the first match is the page's main content, else <body>
+CONTENT_CONTAINERS = [
+    ('div', 'content'),
+    ('div', 'body'),
+    ('div', 'main-content'),
+    ('div', 'topic-content'),
+    ('div', 'section'),
+    ('article', None),
+    ('main', None)
+]
+# Page chrome dropped from the content
+EXCLUDED_TAGS = ['script', 'style', 'nav', 'header', 'footer', 'aside']
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+
+def collapse(text: str) -> str:
+    return " ".join(text.split())
+
+
+def keep_link(href: str, base_url: Optional[str], link_prefix: Optional[str]) -> Optional[str]:
+    """Resolve a link and keep it only if it is a doc page under ``link_prefix``."""
+    full_url = urldefrag(urljoin(base_url or "", href))[0]
+    if full_url.endswith('.html') and (link_prefix is None or full_url.startswith(link_prefix)):
+        return full_url
+    return None
+
+
+def page_result(title: str, content: str, links: List[str], headings: List[Dict[str, str]]) -> Dict:
+    return {"title": title, "content": content, "links": list(dict.fromkeys(links)), "headings": headings}
+
+
+def extract_selectolax(html: str, base_url: Optional[str], link_prefix: Optional[str]) -> Dict:
+    tree = LexborHTMLParser(html)
+    h1 = tree.css_first('h1')
+    title = h1.text().strip() if h1 else ""
+    links = [keep_link(a.attributes.get('href') or "", base_url, link_prefix) for a in tree.css('a[href]')]
+
+    container = None
+    for tag, class_name in CONTENT_CONTAINERS:
+        container = tree.css_first(f"{tag}.{class_name}" if class_name else tag)
+        if container:
+            break
+    container = container or tree.body
+    if container is None:
+        return page_result(title, "", [link for link in links if link], [])
+
+    container.strip_tags(EXCLUDED_TAGS, recursive=True)
+    headings = [{"level": node.tag, "text": collapse(node.text())} for node in container.css(", ".join(HEADING_TAGS))]
+    content = collapse(container.text(separator=" "))
+    return page_result(title, content, [link for link in links if link], [h for h in headings if h["text"]])
+
+
+def has_class(class_name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def extract_lxml(html: str, base_url: Optional[str], link_prefix: Optional[str]) -> Dict:
+    try:
+        root = lxml.html.document_fromstring(html)
+    except ValueError:
+        # Unicode input may not carry an XML encoding declaration
+        root = lxml.html.document_fromstring(html.encode('utf-8'))
+    h1 = root.find('.//h1')
+    title = h1.text_content().strip() if h1 is not None else ""
+    links = [keep_link(a.get('href'), base_url, link_prefix) for a in root.iterfind('.//a[@href]')]
+
+    container = None
+    for tag, class_name in CONTENT_CONTAINERS:
+        matches = root.xpath(f"//{tag}[{has_class(class_name)}]" if class_name else f"//{tag}")
+        if matches:
+            container = matches[0]
+            break
+    if container is None:
+        container = root.find('body')
+    if container is None:
+        return page_result(title, "", [link for link in links if link], [])
+
+    # drop_tree keeps the text that follows a removed element
+    for element in list(container.iter(*EXCLUDED_TAGS)):
+        element.drop_tree()
+    headings = [{"level": node.tag, "text": collapse(node.text_content())} for node in container.iter(*HEADING_TAGS)]
+    # itertext also yields comment text, which BeautifulSoup leaves out
+    for comment in list(container.iter(lxml.etree.Comment)):
+        comment.drop_tree()
+    content = collapse(" ".join(container.itertext()))
+    return page_result(title, content, [link for link in links if link], [h for h in headings if h["text"]])
+
+
+def extract_bs4(html: str, base_url: Optional[str], link_prefix: Optional[str]) -> Dict:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    h1 = soup.find('h1')
+    title = h1.text.strip() if h1 else ""
+    links = [keep_link(a['href'], base_url, link_prefix) for a in soup.find_all('a', href=True)]
+
+    container = None
+    for tag, class_name in CONTENT_CONTAINERS:
+        container = soup.find(tag, class_=class_name) if class_name else soup.find(tag)
+        if container:
+            break
+    container = container or soup.find('body')
+    if container is None:
+        return page_result(title, "", [link for link in links if link], [])
+
+    for element in container.find_all(EXCLUDED_TAGS):
+        element.decompose()
+    headings = [{"level": node.name, "text": collapse(node.get_text(" "))} for node in container.find_all(HEADING_TAGS)]
+    content = collapse(container.get_text(separator=" "))
+    return page_result(title, content, [link for link in links if link], [h for h in headings if h["text"]])
+
+
+BACKENDS: Dict[str, Callable[[str, Optional[str], Optional[str]], Dict]] = {"bs4": extract_bs4}
+if lxml is not None:
+    BACKENDS["lxml"] = extract_lxml
+if LexborHTMLParser is not None:
+    BACKENDS["selectolax"] = extract_selectolax
+
+
+def default_backend() -> str:
+    if HTML_PARSER != "auto":
+        if HTML_PARSER not in BACKENDS:
+            print(f"HTML parser {HTML_PARSER} is not installed, using the fastest available")
+        else:
+            return HTML_PARSER
+    for name in ("selectolax", "lxml", "bs4"):
+        if name in BACKENDS:
+            return name
+
+
+BACKEND = default_backend()
+
+
+def extract_page(html: str, base_url: Optional[str] = None, link_prefix: Optional[str] = None,
+                 backend: Optional[str] = None) -> Dict:
+    """
+    Parse a documentation page once and pull out everything the callers need.
+
+    Returns the first ``<h1>`` as ``title``, the whitespace-collapsed text of
+    the main content container as ``content``, the ``.html`` links resolved
+    against ``base_url`` that start with ``link_prefix`` as ``links``, and
+    the headings inside the content as ``headings``.
+    """
+    if not html or not html.strip():
+        return page_result("", "", [], [])
+    backend = backend or BACKEND
+    try:
+        return BACKENDS[backend](html, base_url, link_prefix)
+    except Exception as e:
+        if backend == "bs4":
+            raise
+        print(f"{backend} failed to parse {base_url or 'page'}, retrying with BeautifulSoup: {str(e)}")
+        return extract_bs4(html, base_url, link_prefix)
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import random
+import threading
+import weakref
+from typing import Dict, Optional, Tuple, Union
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Shared HTTP clients for outbound page fetches. Keeping one pooled client per
+# process means repeat fetches to docs.oracle.com reuse open keep-alive
+# connections instead of paying for DNS, TCP and TLS on every page.
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+# Open connections kept per host; should cover the fetch and crawl worker counts
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+# Retry n waits HTTP_BACKOFF * 2**n seconds (at most HTTP_BACKOFF_MAX) plus up to HTTP_BACKOFF_JITTER of random jitter
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.3"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "5"))
+HTTP_BACKOFF_JITTER = float(os.getenv("HTTP_BACKOFF_JITTER", "0.5"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import brotli  # noqa: F401
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        BROTLI_AVAILABLE = False
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    # Only advertise encodings the installed decoders can handle
+    'Accept-Encoding': 'gzip, deflate, br' if BROTLI_AVAILABLE else 'gzip, deflate',
+}
+
+Timeout = Union[float, Tuple[float, float]]
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+# An httpx.AsyncClient is tied to the event loop it was first used on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def default_timeout(read: Optional[float] = None) -> Tuple[float, float]:
+    return (HTTP_CONNECT_TIMEOUT, read if read is not None else HTTP_READ_TIMEOUT)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+    except ValueError:
+        pass
+    return min(HTTP_BACKOFF * 2 ** attempt, HTTP_BACKOFF_MAX) + random.uniform(0, HTTP_BACKOFF_JITTER)
+
+
+def build_retry() -> Retry:
+    options = dict(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        backoff_max=HTTP_BACKOFF_MAX,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        # Hand the last response back to the caller rather than raising MaxRetryError
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=HTTP_BACKOFF_JITTER, **options)
+    except TypeError:
+        # urllib3 < 2 has neither backoff_jitter nor backoff_max
+        options.pop("backoff_max")
+        return Retry(**options)
+
+
+def get_session() -> requests.Session:
+    """The process-wide pooled session used by the threaded fetchers."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(DEFAULT_HEADERS)
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=HTTP_POOL_SIZE, max_retries=build_retry())
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """The pooled async client for the running event loop, HTTP/2 when h2 is installed."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE * 2, max_keepalive_connections=HTTP_POOL_SIZE),
+            http2=HTTP2_AVAILABLE,
+            follow_redirects=True,
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def get(url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[Timeout] = None,
+        params: Optional[Dict] = None) -> requests.Response:
+    """GET through the shared session; idempotent failures are retried with jittered backoff."""
+    return get_session().get(url, headers=headers, params=params, timeout=timeout or default_timeout())
+
+
+async def aget(url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[Timeout] = None,
+               params: Optional[Dict] = None) -> httpx.Response:
+    """Async version of get."""
+    client = get_async_client()
+    if isinstance(timeout, tuple):
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+    request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+    for attempt in range(HTTP_RETRIES + 1):
+        retry_after = None
+        try:
+            response = await client.get(url, headers=headers, params=params, timeout=request_timeout)
+            if response.status_code not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+                return response
+            retry_after = response.headers.get("Retry-After")
+            await response.aclose()
+        except httpx.TransportError:
+            if attempt == HTTP_RETRIES:
+                raise
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+
+def close():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+async def aclose():
+    """Close the async client of the running loop and the shared session."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+    close()
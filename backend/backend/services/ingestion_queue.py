@@ -0,0 +1,184 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from .database import (
+    claim_ingestion_job,
+    finish_ingestion_job,
+    renew_ingestion_leases,
+    requeue_expired_ingestion_jobs,
+    retry_ingestion_job,
+    update_ingestion_job_progress)
+from .vector_store_db import ingest_document
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Seconds an idle worker waits before checking the queue again
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "2"))
+# Minimum seconds between chunk-count updates written for a running job
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "2"))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+# A running job stays with its process while the process renews the lease;
+# it is requeued once the lease lapses, e.g. after a crash
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "60"))
+INGEST_HEARTBEAT_INTERVAL = float(os.getenv("INGEST_HEARTBEAT_INTERVAL", str(INGEST_LEASE_SECONDS / 3)))
+# Tries per job, counting ones cut short by a crash, before it is failed for good
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+
+_owner_token = uuid.uuid4().hex[:8]
+
+
+def lease_owner() -> str:
+    """Identifies this process on the jobs it runs; the pid keeps forked workers apart."""
+    return f"{socket.gethostname()}:{os.getpid()}:{_owner_token}"
+
+
+def discard_upload(file_path: str):
+    # Uploaded files are only kept until they are indexed; files ingested in place are left alone
+    upload_dir = os.path.abspath(UPLOAD_DIR)
+    if os.path.abspath(file_path).startswith(upload_dir + os.sep) and os.path.exists(file_path):
+        os.remove(file_path)
+        # Bulk uploads are saved in a directory per batch
+        parent = os.path.dirname(os.path.abspath(file_path))
+        try:
+            if parent != upload_dir and not os.listdir(parent):
+                os.rmdir(parent)
+        except OSError:
+            pass
+
+
+class LeaseHeartbeat:
+    """
+    Background thread that renews the leases on this process's running jobs
+    and requeues jobs whose owners have stopped renewing theirs.
+    """
+
+    def __init__(self, interval: float = INGEST_HEARTBEAT_INTERVAL, lease_seconds: float = INGEST_LEASE_SECONDS):
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.on_requeue = None
+
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name="ingest-lease", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def run(self):
+        while True:
+            self.beat()
+            if self.stopping.wait(self.interval):
+                return
+
+    def beat(self):
+        try:
+            renew_ingestion_leases(lease_owner(), self.lease_seconds)
+            requeued = requeue_expired_ingestion_jobs()
+            if requeued:
+                print(f"Requeued {requeued} ingestion jobs whose lease expired")
+                if self.on_requeue:
+                    self.on_requeue()
+        except Exception as e:
+            print(f"Error renewing ingestion leases: {str(e)}")
+
+
+lease_heartbeat = LeaseHeartbeat()
+
+
+class IngestionWorker:
+    """
+    Pool of threads that index uploaded documents from the ingestion_jobs table.
+
+    The queue lives in SQLite, so jobs survive a restart. A running job is
+    leased to the process running it, and jobs left behind by a process that
+    died are put back on the queue once their lease expires. Jobs that other
+    live processes are running, including bulk runs, are left alone.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, poll_interval: float = INGEST_POLL_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads: List[threading.Thread] = []
+
+    def start(self):
+        if self.threads:
+            return
+        lease_heartbeat.on_requeue = self.notify
+        lease_heartbeat.start()
+        self.stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop taking new jobs. Jobs still running are requeued once their lease expires."""
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+        lease_heartbeat.stop()
+
+    def notify(self):
+        """Wake an idle worker after a job is enqueued."""
+        self.wakeup.set()
+
+    def work(self):
+        while not self.stopping.is_set():
+            try:
+                job = claim_ingestion_job(lease_owner(), INGEST_LEASE_SECONDS, INGEST_MAX_ATTEMPTS)
+            except Exception as e:
+                print(f"Error claiming ingestion job: {str(e)}")
+                job = None
+            if job is None:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            if job['status'] == 'failed':
+                print(f"Giving up on {job['file_path']} (job {job['id']}): {job['error']}")
+                discard_upload(job['file_path'])
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: Dict):
+        print(f"Ingesting {job['file_path']} (job {job['id']}, document {job['file_id']})")
+        last_update = [0.0]
+
+        def on_progress(stats: Dict):
+            now = time.monotonic()
+            if now - last_update[0] >= INGEST_PROGRESS_INTERVAL:
+                last_update[0] = now
+                update_ingestion_job_progress(job['id'], stats['chunks'])
+
+        try:
+            stats = ingest_document(job['file_path'], job['file_id'], job['user_id'], on_progress=on_progress)
+        except Exception as e:
+            print(f"Error ingesting {job['file_path']}: {str(e)}")
+            if job['attempts'] < INGEST_MAX_ATTEMPTS:
+                # The upload is kept for the next attempt
+                retry_ingestion_job(job['id'], str(e), job['owner'])
+            elif finish_ingestion_job(job['id'], 'failed', chunks=0, error=str(e), owner=job['owner']):
+                discard_upload(job['file_path'])
+            return
+        # If the lease lapsed and another worker took the job over, the upload is still in use
+        if finish_ingestion_job(job['id'], 'done', chunks=stats['chunks'], owner=job['owner']):
+            discard_upload(job['file_path'])
+
+
+ingestion_worker = IngestionWorker()
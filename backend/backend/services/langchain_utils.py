@@ -1,8 +1,8 @@
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough, RunnableWithMessageHistory, Runnable
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnablePassthrough, RunnableWithMessageHistory, Runnable, RunnableLambda, RunnableBranch
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from langchain_core.prompts import MessagesPlaceholder
 from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
@@ -13,10 +13,17 @@ from langchain_community.utilities import SerpAPIWrapper
 from langchain_community.document_loaders import UnstructuredURLLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from .vector_store_db import vectorstore
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .vector_store_db import vectorstore, bm25_index
+from .bm25_index import reciprocal_rank_fusion
+from .context_builder import build_context
+from .reformulation import coverage_hits, needs_reformulation, reusable_speculation
+from .semantic_cache import answer_cache
 from .database import get_chat_history
-from .netsuite_scraper import NetSuiteSearch
-from typing import List, Dict, Tuple
+from .netsuite_search import NetSuiteSearch
+from typing import List, Dict, Tuple, AsyncIterator, Optional
 import os
 from dotenv import load_dotenv
 
@@ -26,15 +33,63 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
 
+# "hybrid" fuses the Chroma and BM25 rankings, "local" uses Chroma alone; both
+# fall back to live web search when the local match is weak. "web" always searches
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+VECTOR_SCORE_THRESHOLD = float(os.getenv("VECTOR_SCORE_THRESHOLD", "0.75"))
+# Share of the query terms the best BM25 hit must contain to be trusted on its own
+BM25_MIN_COVERAGE = float(os.getenv("BM25_MIN_COVERAGE", "0.75"))
+VECTOR_TOP_K = int(os.getenv("VECTOR_TOP_K", "5"))
+
 print("OPENAI_API_KEY: inside the langchain", OPENAI_API_KEY)
 
+# Process-wide clients, built once per model. Each ChatOpenAI keeps its own
+# HTTP connection pool, so reusing it keeps connections to the API warm
+llm_clients: Dict[str, ChatOpenAI] = {}
+rag_chains: Dict[str, Runnable] = {}
+web_search_clients: Dict[str, NetSuiteSearch] = {}
+# Reentrant: building a chain takes the lock again to fetch its LLM client
+clients_lock = threading.RLock()
+
 def get_llm(model: str) -> ChatOpenAI:
-    """Get the LLM for the specified model."""
-    return ChatOpenAI(
-        model=model,
-        temperature=0.7,
-        streaming=True
-    )
+    """Get the shared LLM client for the specified model."""
+    llm = llm_clients.get(model)
+    if llm is None:
+        with clients_lock:
+            llm = llm_clients.get(model)
+            if llm is None:
+                llm = llm_clients[model] = ChatOpenAI(
+                    model=model,
+                    temperature=0.7,
+                    streaming=True
+                )
+    return llm
+
+def get_web_search() -> NetSuiteSearch:
+    """Get the shared NetSuite search client."""
+    search = web_search_clients.get(SERPAPI_API_KEY)
+    if search is None:
+        with clients_lock:
+            search = web_search_clients.get(SERPAPI_API_KEY)
+            if search is None:
+                search = web_search_clients[SERPAPI_API_KEY] = NetSuiteSearch(SERPAPI_API_KEY)
+    return search
+
+def results_to_documents(results: List[Dict[str, str]]) -> List[Document]:
+    """Convert processed search results to documents."""
+    docs = []
+    for result in results:
+        doc = Document(
+            page_content=result["content"],
+            metadata={
+                "title": result["title"],
+                "url": result["url"],
+                "snippet": result["snippet"],
+                "source": "netsuite_docs"
+            }
+        )
+        docs.append(doc)
+    return docs
 
 def web_search_retriever(query: str) -> List[Document]:
     """
@@ -42,8 +97,7 @@ def web_search_retriever(query: str) -> List[Document]:
     """
     try:
         print(f"\n🔍 Performing web search for query: {query}")
-        # Initialize NetSuiteSearch
-        search = NetSuiteSearch(SERPAPI_API_KEY)
+        search = get_web_search()
         
         # Get search results
         results = search.search_documentation(query)
@@ -54,19 +108,30 @@ def web_search_retriever(query: str) -> List[Document]:
             return []
             
         # Convert results to documents
-        docs = []
-        for result in results:
-            doc = Document(
-                page_content=result["content"],
-                metadata={
-                    "title": result["title"],
-                    "url": result["url"],
-                    "snippet": result["snippet"],
-                    "source": "netsuite_docs"
-                }
-            )
-            docs.append(doc)
+        docs = results_to_documents(results)
+        print(f"📑 Created {len(docs)} documents")
+        return docs
+        
+    except Exception as e:
+        print(f"❌ Error in web search retriever: {str(e)}")
+        return []
+
+async def aweb_search_retriever(query: str) -> List[Document]:
+    """
+    Async version of web_search_retriever.
+    """
+    try:
+        print(f"\n🔍 Performing web search for query: {query}")
+        search = get_web_search()
+        
+        results = await search.asearch_documentation(query)
+        print(f"📊 Found {len(results)} search results")
+        
+        if not results:
+            print("⚠️ No results found")
+            return []
             
+        docs = results_to_documents(results)
         print(f"📑 Created {len(docs)} documents")
         return docs
         
@@ -74,6 +139,182 @@ def web_search_retriever(query: str) -> List[Document]:
         print(f"❌ Error in web search retriever: {str(e)}")
         return []
 
+def vector_store_retriever(query: str) -> Tuple[List[Document], float]:
+    """
+    Search the local Chroma index of NetSuite documentation.
+    
+    Returns the matching documents and the best relevance score (0 when nothing matched).
+    """
+    try:
+        print(f"\n📚 Searching vector store for query: {query}")
+        results = vectorstore.similarity_search_with_relevance_scores(
+            query,
+            k=VECTOR_TOP_K,
+            filter={"source": "netsuite_docs"}
+        )
+        return split_scored_results(results)
+    except Exception as e:
+        print(f"❌ Error in vector store retriever: {str(e)}")
+        return [], 0.0
+
+async def avector_store_retriever(query: str) -> Tuple[List[Document], float]:
+    """
+    Async version of vector_store_retriever.
+    """
+    try:
+        print(f"\n📚 Searching vector store for query: {query}")
+        results = await vectorstore.asimilarity_search_with_relevance_scores(
+            query,
+            k=VECTOR_TOP_K,
+            filter={"source": "netsuite_docs"}
+        )
+        return split_scored_results(results)
+    except Exception as e:
+        print(f"❌ Error in vector store retriever: {str(e)}")
+        return [], 0.0
+
+def split_scored_results(results: List[Tuple[Document, float]]) -> Tuple[List[Document], float]:
+    docs = [doc for doc, _ in results]
+    top_score = max((score for _, score in results), default=0.0)
+    print(f"📊 Found {len(docs)} indexed chunks, top score {top_score:.3f}")
+    return docs, top_score
+
+def fuse_rankings(vector_docs: List[Document], lexical_hits: List[Tuple[str, float, float]]) -> List[Document]:
+    """Fuse the vector and BM25 rankings with reciprocal-rank fusion."""
+    docs_by_id = {doc.id: doc for doc in vector_docs}
+    missing = [chunk_id for chunk_id, _, _ in lexical_hits if chunk_id not in docs_by_id]
+    if missing:
+        stored = vectorstore.get(ids=missing, include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+            docs_by_id[chunk_id] = Document(id=chunk_id, page_content=text, metadata=metadata or {})
+    
+    fused_ids = reciprocal_rank_fusion([
+        [doc.id for doc in vector_docs],
+        [chunk_id for chunk_id, _, _ in lexical_hits]
+    ])
+    return [docs_by_id[chunk_id] for chunk_id in fused_ids if chunk_id in docs_by_id][:VECTOR_TOP_K]
+
+def match_ratio(value: float, threshold: float) -> float:
+    return value / threshold if threshold > 0 else float("inf")
+
+def match_strength(top_score: float, lexical_hits: List[Tuple[str, float, float]]) -> float:
+    """How well the local index matched, scaled so that 1.0 is just enough to skip web search."""
+    top_coverage = lexical_hits[0][2] if lexical_hits else 0.0
+    return max(match_ratio(top_score, VECTOR_SCORE_THRESHOLD), match_ratio(top_coverage, BM25_MIN_COVERAGE))
+
+def hybrid_retriever(query: str) -> Tuple[List[Document], float]:
+    """
+    Retrieve from the Chroma and BM25 indexes and fuse the rankings.
+    
+    Returns the fused documents and the match strength (see match_strength).
+    """
+    try:
+        vector_docs, top_score = vector_store_retriever(query)
+        lexical_hits = bm25_index.search(query, k=VECTOR_TOP_K)
+        print(f"🔤 Found {len(lexical_hits)} BM25 matches")
+        return fuse_rankings(vector_docs, lexical_hits), match_strength(top_score, lexical_hits)
+    except Exception as e:
+        print(f"❌ Error in hybrid retriever: {str(e)}")
+        return [], 0.0
+
+async def ahybrid_retriever(query: str) -> Tuple[List[Document], float]:
+    """
+    Async version of hybrid_retriever.
+    """
+    try:
+        vector_docs, top_score = await avector_store_retriever(query)
+        lexical_hits = bm25_index.search(query, k=VECTOR_TOP_K)
+        print(f"🔤 Found {len(lexical_hits)} BM25 matches")
+        docs = await asyncio.to_thread(fuse_rankings, vector_docs, lexical_hits)
+        return docs, match_strength(top_score, lexical_hits)
+    except Exception as e:
+        print(f"❌ Error in hybrid retriever: {str(e)}")
+        return [], 0.0
+
+def local_retriever(query: str) -> Tuple[List[Document], str, float]:
+    """
+    Retrieve from the local indexes only, without falling back to web search.
+    
+    Returns the documents, the retrieval source and the match strength.
+    """
+    if RETRIEVAL_MODE == "hybrid":
+        docs, strength = hybrid_retriever(query)
+        return docs, "hybrid", strength
+    if RETRIEVAL_MODE == "local":
+        docs, top_score = vector_store_retriever(query)
+        return docs, "vector_store", match_ratio(top_score, VECTOR_SCORE_THRESHOLD)
+    return [], "web_search", 0.0
+
+async def alocal_retriever(query: str) -> Tuple[List[Document], str, float]:
+    """
+    Async version of local_retriever.
+    """
+    if RETRIEVAL_MODE == "hybrid":
+        docs, strength = await ahybrid_retriever(query)
+        return docs, "hybrid", strength
+    if RETRIEVAL_MODE == "local":
+        docs, top_score = await avector_store_retriever(query)
+        return docs, "vector_store", match_ratio(top_score, VECTOR_SCORE_THRESHOLD)
+    return [], "web_search", 0.0
+
+def confident_local_match(result: Tuple[List[Document], str, float]) -> Optional[Tuple[List[Document], str]]:
+    """The local documents if they matched well enough to skip web search, else None."""
+    docs, source, strength = result
+    if docs and strength >= 1.0:
+        return docs, source
+    if RETRIEVAL_MODE != "web":
+        print("↪️ Local match too weak, falling back to web search")
+    return None
+
+def speculative_result(query: str, speculative: Optional[Tuple[str, Tuple]]) -> Optional[Tuple[List[Document], str, float]]:
+    """
+    The speculative local result if it also answers the reformulated question.
+    
+    A rewritten question is scored against the speculative documents by term
+    coverage, so the result is reused when it covers the rewrite well enough
+    to skip web search, without another embedding call or index query.
+    """
+    result = reusable_speculation(query, speculative)
+    if result is not None or not speculative:
+        return result
+    docs, source, _ = speculative[1]
+    strength = match_strength(0.0, coverage_hits(query, docs))
+    if docs and strength >= 1.0:
+        print("♻️ Reusing speculative retrieval for the reformulated question")
+        return docs, source, strength
+    return None
+
+def retrieve_documents(query: str, speculative: Optional[Tuple[str, Tuple]] = None) -> Tuple[List[Document], str]:
+    """
+    Retrieve documents for the query and report which path answered.
+    
+    ``speculative`` is a ``(raw question, local_retriever result)`` pair run
+    while the question was being reformulated; it is used in place of local
+    retrieval when it still matches the reformulated question (see
+    speculative_result).
+    
+    Returns the documents and the retrieval source: "hybrid", "vector_store" or "web_search".
+    """
+    result = speculative_result(query, speculative)
+    if result is None:
+        result = local_retriever(query)
+    match = confident_local_match(result)
+    if match:
+        return match
+    return web_search_retriever(query), "web_search"
+
+async def aretrieve_documents(query: str, speculative: Optional[Tuple[str, Tuple]] = None) -> Tuple[List[Document], str]:
+    """
+    Async version of retrieve_documents.
+    """
+    result = speculative_result(query, speculative)
+    if result is None:
+        result = await alocal_retriever(query)
+    match = confident_local_match(result)
+    if match:
+        return match
+    return await aweb_search_retriever(query), "web_search"
+
 contextualize_q_system_prompt = (
     "You are a NetSuite documentation expert. Given a chat history and the latest user question "
     "which might reference context in the chat history, formulate a standalone question which can be understood "
@@ -107,103 +348,330 @@ qa_prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}")
 ])
 
-def format_answer(docs: List[Document], query: str, chat_history: List[Dict], llm: ChatOpenAI) -> str:
-    """Format the answer using the retrieved documents and chat history."""
-    print("\n🤖 Formatting answer...")
-    # Create a prompt for the answer
-    answer_prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a NetSuite documentation expert. Use the following context from NetSuite's official documentation to answer the question. "
-                  "Make sure to provide accurate and relevant information based on the context. "
-                  "If the context doesn't contain enough information, say so clearly. "
-                  "Use NetSuite-specific terminology and concepts in your response. "
-                  "Include relevant NetSuite features, modules, or functionality when applicable."),
-        ("system", "Context: {context}"),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{question}")
-    ])
+answer_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are a NetSuite documentation expert. Use the following context from NetSuite's official documentation to answer the question. "
+              "Make sure to provide accurate and relevant information based on the context. "
+              "If the context doesn't contain enough information, say so clearly. "
+              "Use NetSuite-specific terminology and concepts in your response. "
+              "Include relevant NetSuite features, modules, or functionality when applicable."),
+    ("system", "Context: {context}"),
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "{question}")
+])
+
+reformulation_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are a NetSuite documentation expert. Reformulate questions based on chat history. "
+              "Your goal is to make the question more specific and clear by incorporating context from the chat history. "
+              "Focus on NetSuite-specific terminology and concepts. "
+              "Make sure the reformulated question maintains the original intent while being more precise."),
+    ("human", "Chat History:\n{chat_history}\n\nCurrent Question: {question}\n\nReformulated Question:")
+])
+
+def to_message(msg) -> Optional[BaseMessage]:
+    """Chat history entries are either role/content dicts or ready-made messages."""
+    if isinstance(msg, BaseMessage):
+        return msg
+    if msg["role"] == "human":
+        return HumanMessage(content=msg["content"])
+    if msg["role"] == "ai":
+        return AIMessage(content=msg["content"])
+    return None
+
+def answer_context(docs: List[Document], query: str, search_query: Optional[str] = None) -> str:
+    """
+    The best-matching chunks of the documents, ranked against ``search_query``
+    (the reformulated question) when given, within CONTEXT_TOKEN_BUDGET.
+    """
+    context, stats = build_context(docs, search_query or query)
+    print(f"📚 Using {stats['kept']} of {stats['chunks']} chunks from {stats['pages']} documents as context "
+          f"({stats['tokens']}/{stats['budget']} tokens, {stats['duplicates']} duplicates skipped)")
+    return context
+
+def build_answer_inputs(docs: List[Document], query: str, chat_history: List[Dict], search_query: Optional[str] = None,
+                        context: Optional[str] = None) -> Dict:
+    """
+    Build the answer prompt inputs from the retrieved documents and chat history.
+    
+    Pass ``context`` when it was already built with answer_context.
+    """
+    if context is None:
+        context = answer_context(docs, query, search_query)
     
-    # Format the context from documents
-    context = "\n\n".join([doc.page_content for doc in docs])
-    print(f"📚 Using {len(docs)} document chunks as context")
-    
-    # Convert chat history to list of messages
-    messages = []
-    for msg in chat_history:
-        if msg["role"] == "human":
-            messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "ai":
-            messages.append(AIMessage(content=msg["content"]))
+    # Convert chat history to list of messages; cached history is already converted
+    messages = [message for message in map(to_message, chat_history) if message is not None]
     print(f"💬 Including {len(chat_history)} previous conversation turns")
     
-    # Get the answer
-    print("🤔 Generating response...")
-    answer_chain = answer_prompt | llm
-    response = answer_chain.invoke({
+    return {
         "context": context,
         "chat_history": messages,
         "question": query
-    })
+    }
+
+def format_answer(docs: List[Document], query: str, chat_history: List[Dict], llm: ChatOpenAI, search_query: Optional[str] = None) -> str:
+    """Format the answer using the retrieved documents and chat history."""
+    print("\n🤖 Formatting answer...")
+    inputs = build_answer_inputs(docs, query, chat_history, search_query)
+    
+    # Get the answer
+    print("🤔 Generating response...")
+    answer_chain = answer_prompt | llm
+    response = answer_chain.invoke(inputs)
     
     print("✅ Response generated successfully")
     return response.content
 
+async def aformat_answer(docs: List[Document], query: str, chat_history: List[Dict], llm: ChatOpenAI, search_query: Optional[str] = None) -> str:
+    """Async version of format_answer."""
+    print("\n🤖 Formatting answer...")
+    # Chunking and scoring the context is CPU-bound; keep it off the event loop
+    context = await asyncio.to_thread(answer_context, docs, query, search_query)
+    inputs = build_answer_inputs(docs, query, chat_history, context=context)
+    
+    print("🤔 Generating response...")
+    answer_chain = answer_prompt | llm
+    response = await answer_chain.ainvoke(inputs)
+    
+    print("✅ Response generated successfully")
+    return response.content
+
+async def astream_answer(docs: List[Document], query: str, chat_history: List[Dict], llm: ChatOpenAI, search_query: Optional[str] = None) -> AsyncIterator[str]:
+    """Stream the answer token by token as the LLM produces it."""
+    print("\n🤖 Streaming answer...")
+    # Chunking and scoring the context is CPU-bound; keep it off the event loop
+    context = await asyncio.to_thread(answer_context, docs, query, search_query)
+    inputs = build_answer_inputs(docs, query, chat_history, context=context)
+    
+    answer_chain = answer_prompt | llm
+    async for chunk in answer_chain.astream(inputs):
+        if chunk.content:
+            yield chunk.content
+    
+    print("✅ Response streamed successfully")
+
+def format_history(chat_history: List[Dict]) -> str:
+    """Format chat history as plain text for the reformulation prompt."""
+    messages = [message for message in map(to_message, chat_history) if message is not None]
+    return "\n".join([f"{message.type.capitalize()}: {message.content}" for message in messages])
+
+def reformulate_question(query: str, chat_history: List[Dict], llm: ChatOpenAI) -> str:
+    """Reformulate the question into a standalone one using the chat history."""
+    if not chat_history:
+        print("📝 No chat history, using original query")
+        return query
+        
+    print("\n🔄 Reformulating question based on chat history...")
+    print(f"💬 Using {len(chat_history)} previous conversation turns")
+    
+    # Format chat history
+    formatted_history = format_history(chat_history)
+    print(f"📝 Previous conversation:\n{formatted_history}")
+    
+    # Get reformulated question
+    reformulation_chain = reformulation_prompt | llm
+    reformulated = reformulation_chain.invoke({
+        "chat_history": formatted_history,
+        "question": query
+    })
+    
+    print(f"📝 Reformulated question: {reformulated.content}")
+    return reformulated.content
+
+async def areformulate_question(query: str, chat_history: List[Dict], llm: ChatOpenAI) -> str:
+    """Async version of reformulate_question."""
+    if not chat_history:
+        print("📝 No chat history, using original query")
+        return query
+        
+    print("\n🔄 Reformulating question based on chat history...")
+    print(f"💬 Using {len(chat_history)} previous conversation turns")
+    
+    reformulation_chain = reformulation_prompt | llm
+    reformulated = await reformulation_chain.ainvoke({
+        "chat_history": format_history(chat_history),
+        "question": query
+    })
+    
+    print(f"📝 Reformulated question: {reformulated.content}")
+    return reformulated.content
+
+# Runs local retrieval on the raw question while the sync path waits on reformulation
+speculative_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-retrieval")
+
+def prepare_question(query: str, chat_history: List[Dict], llm: ChatOpenAI) -> Tuple[str, Optional[Tuple[str, Tuple]]]:
+    """
+    Decide on the question to retrieve for.
+    
+    Returns the (possibly reformulated) question and, when reformulation ran,
+    the speculative local retrieval for the raw question to pass to
+    retrieve_documents.
+    """
+    if not needs_reformulation(query, chat_history):
+        print("📝 Question is self-contained, skipping reformulation")
+        return query, None
+    speculative = speculative_executor.submit(local_retriever, query)
+    question = reformulate_question(query, chat_history, llm)
+    return question, (query, speculative.result())
+
+async def aprepare_question(query: str, chat_history: List[Dict], llm: ChatOpenAI) -> Tuple[str, Optional[Tuple[str, Tuple]]]:
+    """Async version of prepare_question."""
+    if not needs_reformulation(query, chat_history):
+        print("📝 Question is self-contained, skipping reformulation")
+        return query, None
+    question, result = await asyncio.gather(
+        areformulate_question(query, chat_history, llm),
+        alocal_retriever(query)
+    )
+    return question, (query, result)
+
+def docs_to_sources(docs: List[Document]) -> List[Dict]:
+    return [{"title": doc.metadata.get("title", ""), "url": doc.metadata.get("url", "")} for doc in docs]
+
+# Strong references to fire-and-forget tasks so they are not garbage collected
+background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def astream_rag_answer(model: str, query: str, chat_history: List[Dict]) -> AsyncIterator[Dict]:
+    """
+    Run the RAG pipeline and yield progress events as they happen.
+    
+    Yields ``stage`` events when reformulation, retrieval and generation start
+    and finish, a ``token`` event for every generated token and a final
+    ``done`` event carrying the full answer and its sources. Reformulation
+    reports ``skipped`` when the question does not depend on the history.
+    """
+    llm = get_llm(model)
+    
+    if needs_reformulation(query, chat_history):
+        yield {"event": "stage", "stage": "reformulation", "status": "started"}
+    reformulated_question, speculative = await aprepare_question(query, chat_history, llm)
+    status = "completed" if speculative else "skipped"
+    yield {"event": "stage", "stage": "reformulation", "status": status, "question": reformulated_question}
+    
+    yield {"event": "stage", "stage": "retrieval", "status": "started"}
+    cached = await answer_cache.alookup(reformulated_question, model)
+    if cached:
+        yield {"event": "stage", "stage": "retrieval", "status": "completed", "sources": cached["sources"], "retrieval_source": "semantic_cache"}
+        yield {"event": "token", "content": cached["answer"]}
+        yield {"event": "done", "answer": cached["answer"], "sources": cached["sources"], "retrieval_source": "semantic_cache"}
+        return
+    
+    docs, retrieval_source = await aretrieve_documents(reformulated_question, speculative)
+    sources = docs_to_sources(docs)
+    yield {"event": "stage", "stage": "retrieval", "status": "completed", "sources": sources, "retrieval_source": retrieval_source}
+    
+    yield {"event": "stage", "stage": "generation", "status": "started"}
+    answer_parts = []
+    async for token in astream_answer(docs, query, chat_history, llm, reformulated_question):
+        answer_parts.append(token)
+        yield {"event": "token", "content": token}
+    yield {"event": "stage", "stage": "generation", "status": "completed"}
+    
+    answer = "".join(answer_parts)
+    if docs:
+        run_in_background(answer_cache.asave(reformulated_question, model, answer, sources, retrieval_source))
+    yield {"event": "done", "answer": answer, "sources": sources, "retrieval_source": retrieval_source}
+
 def get_rag_chain(model: str) -> Runnable:
-    """Get the RAG chain for the specified model."""
+    """Get the RAG chain for the specified model, building it on first use."""
+    chain = rag_chains.get(model)
+    if chain is None:
+        with clients_lock:
+            chain = rag_chains.get(model)
+            if chain is None:
+                chain = rag_chains[model] = build_rag_chain(model)
+    return chain
+
+def warm_rag_chains(models: List[str]):
+    """Build the clients and chains for every model ahead of the first request."""
+    get_web_search()
+    for model in models:
+        get_rag_chain(model)
+    print(f"🔥 Warmed RAG chains for {', '.join(models)}")
+
+def build_rag_chain(model: str) -> Runnable:
+    """Build the RAG chain for the specified model."""
     print(f"\n🔄 Initializing RAG chain with model: {model}")
     llm = get_llm(model)
     
-    # Create a custom retriever that uses web search
-    def custom_retriever(query: str) -> List[Document]:
-        return web_search_retriever(query)
+    # Each step has a sync and an async implementation so the chain runs
+    # natively under both invoke() and ainvoke()
+    def prepare(x: Dict) -> Dict:
+        question, speculative = prepare_question(x["input"], x.get("chat_history", []), llm)
+        return {**x, "reformulated_question": question, "speculative": speculative}
     
-    # Create a reformulation function that uses the LLM
-    def reformulate_question(query: str, chat_history: List[Dict]) -> str:
-        if not chat_history:
-            print("📝 No chat history, using original query")
-            return query
-            
-        print("\n🔄 Reformulating question based on chat history...")
-        print(f"💬 Using {len(chat_history)} previous conversation turns")
-        # Create a prompt for reformulation
-        reformulation_prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a NetSuite documentation expert. Reformulate questions based on chat history. "
-                      "Your goal is to make the question more specific and clear by incorporating context from the chat history. "
-                      "Focus on NetSuite-specific terminology and concepts. "
-                      "Make sure the reformulated question maintains the original intent while being more precise."),
-            ("human", "Chat History:\n{chat_history}\n\nCurrent Question: {question}\n\nReformulated Question:")
-        ])
-        
-        # Format chat history
-        formatted_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history])
-        print(f"📝 Previous conversation:\n{formatted_history}")
-        
-        # Get reformulated question
-        reformulation_chain = reformulation_prompt | llm
-        reformulated = reformulation_chain.invoke({
-            "chat_history": formatted_history,
-            "question": query
-        })
-        
-        print(f"📝 Reformulated question: {reformulated.content}")
-        return reformulated.content
+    async def aprepare(x: Dict) -> Dict:
+        question, speculative = await aprepare_question(x["input"], x.get("chat_history", []), llm)
+        return {**x, "reformulated_question": question, "speculative": speculative}
+    
+    def lookup_cache(x: Dict) -> Optional[Dict]:
+        return answer_cache.lookup(x["reformulated_question"], model)
+    
+    async def alookup_cache(x: Dict) -> Optional[Dict]:
+        return await answer_cache.alookup(x["reformulated_question"], model)
+    
+    def is_cached(x: Dict) -> bool:
+        return x["cached"] is not None
+    
+    async def ais_cached(x: Dict) -> bool:
+        return x["cached"] is not None
+    
+    def cached_answer(x: Dict) -> Dict:
+        return {
+            "answer": x["cached"]["answer"],
+            "docs": [],
+            "sources": x["cached"]["sources"],
+            "retrieval_source": "semantic_cache"
+        }
+    
+    async def acached_answer(x: Dict) -> Dict:
+        return cached_answer(x)
+    
+    def retrieve(x: Dict) -> Dict:
+        docs, retrieval_source = retrieve_documents(x["reformulated_question"], x["speculative"])
+        return {**x, "docs": docs, "retrieval_source": retrieval_source}
+    
+    async def aretrieve(x: Dict) -> Dict:
+        docs, retrieval_source = await aretrieve_documents(x["reformulated_question"], x["speculative"])
+        return {**x, "docs": docs, "retrieval_source": retrieval_source}
+    
+    def answer(x: Dict) -> Dict:
+        result = {
+            "answer": format_answer(x["docs"], x["input"], x.get("chat_history", []), llm, x["reformulated_question"]),
+            "docs": x["docs"],
+            "sources": docs_to_sources(x["docs"]),
+            "retrieval_source": x["retrieval_source"]
+        }
+        if x["docs"]:
+            answer_cache.save(x["reformulated_question"], model, result["answer"], result["sources"], result["retrieval_source"])
+        return result
+    
+    async def aanswer(x: Dict) -> Dict:
+        result = {
+            "answer": await aformat_answer(x["docs"], x["input"], x.get("chat_history", []), llm, x["reformulated_question"]),
+            "docs": x["docs"],
+            "sources": docs_to_sources(x["docs"]),
+            "retrieval_source": x["retrieval_source"]
+        }
+        if x["docs"]:
+            # Caching embeds the question again; keep it off the response path
+            run_in_background(answer_cache.asave(x["reformulated_question"], model, result["answer"], result["sources"], result["retrieval_source"]))
+        return result
     
     # Create the RAG chain
     print("🔗 Creating RAG chain...")
     rag_chain = (
-        {
-            "input": lambda x: x["input"],
-            "chat_history": lambda x: x.get("chat_history", [])
-        }
+        RunnableLambda(prepare, afunc=aprepare)
         | RunnablePassthrough.assign(
-            reformulated_question=lambda x: reformulate_question(x["input"], x["chat_history"])
+            cached=RunnableLambda(lookup_cache, afunc=alookup_cache)
         )
-        | RunnablePassthrough.assign(
-            docs=lambda x: custom_retriever(x["reformulated_question"])
+        | RunnableBranch(
+            (RunnableLambda(is_cached, afunc=ais_cached), RunnableLambda(cached_answer, afunc=acached_answer)),
+            RunnableLambda(retrieve, afunc=aretrieve) | RunnableLambda(answer, afunc=aanswer)
         )
-        | {
-            "answer": lambda x: format_answer(x["docs"], x["input"], x["chat_history"], llm),
-            "docs": lambda x: x["docs"]
-        }
     )
     
     print("✅ RAG chain initialized successfully")
@@ -0,0 +1,137 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .database import insert_application_logs_batch
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# A batch is written once it reaches LOG_BATCH_SIZE records or LOG_FLUSH_INTERVAL seconds, whichever comes first
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_WRITE_RETRIES = int(os.getenv("LOG_WRITE_RETRIES", "3"))
+
+
+class LogWriter:
+    """
+    Write-behind logger for chat turns.
+
+    ``log`` only puts the record on a bounded queue; a background thread
+    writes queued records to application_logs in batched transactions. When
+    the queue is full new records are dropped and counted rather than
+    blocking the request.
+    """
+
+    def __init__(self, max_queue: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, retries: int = LOG_WRITE_RETRIES):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        # Serializes the background thread with synchronous drains
+        self.write_lock = threading.Lock()
+        # Records accepted but not yet written or given up on
+        self.pending = 0
+        self.settled = threading.Condition()
+        self.counters = {"enqueued": 0, "written": 0, "dropped": 0, "batches": 0, "write_errors": 0}
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Write everything still queued, then stop the background thread."""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+        self.drain()
+
+    def log(self, session_id, user_query, gpt_response, model, user_id=None) -> bool:
+        # Same format as SQLite's CURRENT_TIMESTAMP, taken when the turn happened
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with self.settled:
+            try:
+                self.queue.put_nowait((session_id, user_query, gpt_response, model, user_id, created_at))
+            except queue.Full:
+                self.counters["dropped"] += 1
+                return False
+            self.pending += 1
+            self.counters["enqueued"] += 1
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Write every record logged so far before returning, e.g. ahead of a delete."""
+        self.drain()
+        # A batch the background thread picked up just before the drain may still be in flight
+        with self.settled:
+            return self.settled.wait_for(lambda: self.pending == 0, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "queue_depth": self.queue.qsize(), "queue_capacity": self.queue.maxsize}
+
+    def run(self):
+        while not self.stopping.is_set():
+            batch = self.collect()
+            if batch:
+                with self.write_lock:
+                    self.write(batch)
+
+    def collect(self) -> List[tuple]:
+        """Wait for the first record, then gather more until the batch is full or the interval ends."""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def drain(self):
+        with self.write_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                self.write(batch)
+
+    def write(self, batch: List[tuple]):
+        for attempt in range(self.retries + 1):
+            try:
+                insert_application_logs_batch(batch)
+                self.settle(batch, "written")
+                self.counters["batches"] += 1
+                return
+            except Exception as e:
+                self.counters["write_errors"] += 1
+                print(f"Error writing {len(batch)} chat logs (attempt {attempt + 1}): {str(e)}")
+                time.sleep(min(2 ** attempt * 0.1, 2))
+        self.settle(batch, "dropped")
+
+    def settle(self, batch: List[tuple], outcome: str):
+        with self.settled:
+            self.counters[outcome] += len(batch)
+            self.pending -= len(batch)
+            self.settled.notify_all()
+
+
+log_writer = LogWriter()
@@ -1,278 +1,225 @@
-import requests
-from bs4 import BeautifulSoup
 import logging
-from typing import List, Dict, Set
-import re
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Set, Iterator, Optional, Tuple
 import json
 from datetime import datetime
 import time
-from urllib.parse import urljoin
-from langchain_community.utilities import SerpAPIWrapper
+from urllib.parse import urljoin, urlparse
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
+from . import http_client
+from .html_extract import extract_page
+from .netsuite_search import NetSuiteSearch
+from .rate_limit import TokenBucket
 
-class NetSuiteSearch:
-    def __init__(self, serpapi_api_key: str):
-        self.search = SerpAPIWrapper(serpapi_api_key=serpapi_api_key)
+# Crawl progress is checkpointed here so an interrupted crawl can resume
+CRAWL_STATE_DB = os.getenv("CRAWL_STATE_DB", "crawl_state.db")
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "8"))
+# Politeness budget per host: sustained requests per second and burst size
+CRAWL_RATE = float(os.getenv("CRAWL_RATE", "2"))
+CRAWL_BURST = int(os.getenv("CRAWL_BURST", "4"))
+CRAWL_MAX_ATTEMPTS = int(os.getenv("CRAWL_MAX_ATTEMPTS", "3"))
+
+
+class CrawlState:
+    """
+    SQLite-backed crawl frontier and page store.
+
+    URLs move pending -> in_progress -> done/failed. Only the crawl coordinator
+    thread touches the connection.
+    """
+
+    def __init__(self, db_path: str = CRAWL_STATE_DB):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS crawl_frontier
+                             (url TEXT PRIMARY KEY,
+                              depth INTEGER,
+                              status TEXT DEFAULT 'pending',
+                              attempts INTEGER DEFAULT 0,
+                              updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_crawl_frontier_status ON crawl_frontier (status, depth)')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS crawl_pages
+                             (url TEXT PRIMARY KEY,
+                              title TEXT,
+                              content TEXT,
+                              crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        self.conn.commit()
+
+    def has_unfinished(self) -> bool:
+        row = self.conn.execute("SELECT 1 FROM crawl_frontier WHERE status IN ('pending', 'in_progress') LIMIT 1").fetchone()
+        return row is not None
+
+    def reset(self):
+        self.conn.execute('DELETE FROM crawl_frontier')
+        self.conn.execute('DELETE FROM crawl_pages')
+        self.conn.commit()
+
+    def requeue_in_progress(self):
+        """URLs that were in flight when the last crawl stopped go back in the queue."""
+        self.conn.execute("UPDATE crawl_frontier SET status = 'pending' WHERE status = 'in_progress'")
+        self.conn.commit()
+
+    def enqueue(self, urls: Set[str], depth: int):
+        self.conn.executemany('INSERT OR IGNORE INTO crawl_frontier (url, depth) VALUES (?, ?)',
+                              [(url, depth) for url in urls])
+
+    def claim(self, limit: int) -> List[sqlite3.Row]:
+        # Breadth-first: shallow pages first
+        rows = self.conn.execute("SELECT url, depth FROM crawl_frontier WHERE status = 'pending' ORDER BY depth LIMIT ?",
+                                 (limit,)).fetchall()
+        self.conn.executemany("UPDATE crawl_frontier SET status = 'in_progress', updated_at = CURRENT_TIMESTAMP WHERE url = ?",
+                              [(row['url'],) for row in rows])
+        self.conn.commit()
+        return rows
+
+    def complete(self, url: str, page: Optional[Dict[str, str]]):
+        if page:
+            self.conn.execute('INSERT OR REPLACE INTO crawl_pages (url, title, content) VALUES (?, ?, ?)',
+                              (url, page['title'], page['content']))
+        self.conn.execute("UPDATE crawl_frontier SET status = 'done', updated_at = CURRENT_TIMESTAMP WHERE url = ?", (url,))
+        self.conn.commit()
+
+    def fail(self, url: str, max_attempts: int):
+        self.conn.execute("UPDATE crawl_frontier SET attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP, "
+                          "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE url = ?",
+                          (max_attempts, url))
+        self.conn.commit()
+
+    def urls_with_status(self, status: str) -> Set[str]:
+        rows = self.conn.execute('SELECT url FROM crawl_frontier WHERE status = ?', (status,)).fetchall()
+        return {row['url'] for row in rows}
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.conn.execute('SELECT status, COUNT(*) AS n FROM crawl_frontier GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def iter_pages(self) -> Iterator[Dict[str, str]]:
+        for row in self.conn.execute('SELECT url, title, content FROM crawl_pages ORDER BY url'):
+            yield {"title": row['title'], "content": row['content'], "url": row['url']}
+
+
+class NetSuiteScraper:
+    def __init__(self, max_workers: int = CRAWL_WORKERS, rate: float = CRAWL_RATE, burst: int = CRAWL_BURST):
         self.base_url = "https://docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/"
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-
-    def search_documentation(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
-        """
-        Search NetSuite documentation using SerpAPI and process the results.
-        
-        Args:
-            query: The search query
-            num_results: Number of results to return
-            
-        Returns:
-            List of dictionaries containing processed documentation
-        """
-        # Add site: filter to restrict search to NetSuite docs
-        search_query = f"site:docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/ {query}"
-        
-        try:
-            # Get search results
-            results = self.search.results(search_query, num_results)
-            
-            processed_results = []
-            for result in results:
-                if 'link' in result and result['link'].startswith(self.base_url):
-                    # Fetch and process the page content
-                    content = self.get_page_content(result['link'])
-                    if content:
-                        processed_results.append({
-                            "title": result.get('title', ''),
-                            "url": result['link'],
-                            "content": content,
-                            "snippet": result.get('snippet', '')
-                        })
-            
-            return processed_results
-            
-        except Exception as e:
-            print(f"Error searching documentation: {str(e)}")
-            return []
+        self.timeout = http_client.default_timeout(15)
+        self.max_workers = max_workers
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+
+    def bucket_for(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
 
     def get_page_content(self, url: str) -> str:
-        """Fetch and process a single documentation page."""
+        """Fetch a page, waiting for the host's politeness budget first. Raises on failure."""
+        self.bucket_for(url).acquire()
+        print(f"Fetching page: {url}")
+        response = http_client.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    def is_gone(self, url: str) -> bool:
+        """Re-fetch a page and report whether the site says it no longer exists."""
+        self.bucket_for(url).acquire()
         try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract title
-            title = soup.find('h1')
-            title_text = title.text.strip() if title else ""
-            
-            # Try different content divs
-            content_div = None
-            possible_content_divs = [
-                ('div', 'content'),
-                ('div', 'body'),
-                ('div', 'main-content'),
-                ('div', 'topic-content'),
-                ('div', 'section'),
-                ('article', None),
-                ('main', None)
-            ]
-
-            for tag, class_name in possible_content_divs:
-                if class_name:
-                    content_div = soup.find(tag, class_=class_name)
-                else:
-                    content_div = soup.find(tag)
-                if content_div:
-                    break
+            response = http_client.get(url, timeout=self.timeout)
+        except Exception as e:
+            print(f"Error checking page {url}: {str(e)}")
+            return False
+        return response.status_code in (404, 410)
 
-            if not content_div:
-                content_div = soup.find('body')
-                if not content_div:
-                    return ""
+    def confirm_gone(self, urls: List[str]) -> List[str]:
+        """The subset of ``urls`` that now return 404 or 410."""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="netsuite-check") as pool:
+            return [url for url, gone in zip(urls, pool.map(self.is_gone, urls)) if gone]
 
-            # Remove unwanted elements
-            for element in content_div.find_all(['script', 'style', 'nav', 'header', 'footer', 'aside']):
-                element.decompose()
+    def crawl_page(self, url: str) -> Tuple[Dict[str, str], Set[str]]:
+        """Fetch one page and parse it once for its content, headings and links."""
+        page = extract_page(self.get_page_content(url), url, self.base_url)
+        return {"title": page["title"], "content": page["content"], "url": url, "headings": page["headings"]}, set(page["links"])
 
-            # Get text content
-            content = content_div.get_text(separator='\n', strip=True)
-            
-            # Clean up content
-            content = re.sub(r'\n\s*\n', '\n\n', content)
-            content = re.sub(r'\s+', ' ', content)
-            
-            return content
-            
-        except Exception as e:
-            print(f"Error fetching page {url}: {str(e)}")
-            return ""
+    def parse_content(self, html_content: str, url: str) -> Dict[str, str]:
+        page = extract_page(html_content, url, self.base_url)
+        return {"title": page["title"], "content": page["content"], "url": url, "headings": page["headings"]}
 
-    def get_chunked_documentation(self, query: str, chunk_size: int = 1000) -> List[Dict[str, str]]:
+    def crawl(self, seed_urls: List[str], resume: bool = True, max_pages: Optional[int] = None,
+              state: Optional[CrawlState] = None) -> CrawlState:
         """
-        Search documentation and return chunked results.
-        
+        Crawl breadth-first from the seed URLs through a persisted frontier.
+
         Args:
-            query: The search query
-            chunk_size: Size of each chunk
-            
+            seed_urls: Pages to start from when there is no crawl to resume
+            resume: Continue an interrupted crawl instead of starting over
+            max_pages: Stop after this many pages have been fetched
+            state: Crawl state to use, defaults to CRAWL_STATE_DB
+
         Returns:
-            List of dictionaries containing chunked documentation
+            The crawl state holding the fetched pages
         """
-        results = self.search_documentation(query)
-        chunks = []
-        
-        for result in results:
-            # Create a Document object for the text splitter
-            doc = Document(
-                page_content=result["content"],
-                metadata={
-                    "title": result["title"],
-                    "url": result["url"],
-                    "snippet": result["snippet"]
-                }
-            )
-            
-            # Split the document into chunks
-            doc_chunks = self.text_splitter.split_documents([doc])
-            
-            # Convert chunks to the desired format
-            for chunk in doc_chunks:
-                chunks.append({
-                    "title": chunk.metadata["title"],
-                    "content": chunk.page_content,
-                    "url": chunk.metadata["url"],
-                    "snippet": chunk.metadata["snippet"]
-                })
-        
-        return chunks
+        state = state or CrawlState()
+        if resume and state.has_unfinished():
+            state.requeue_in_progress()
+            print(f"Resuming crawl: {state.counts()}")
+        else:
+            state.reset()
+            state.enqueue(set(seed_urls), 0)
+            state.conn.commit()
 
-class NetSuiteScraper:
-    def __init__(self):
-        self.base_url = "https://docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/"
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        self.visited_urls = set()
-        self.delay = 1  # Delay between requests in seconds
+        fetched = 0
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="netsuite-crawl") as pool:
+            while True:
+                # Keep the pool busy without pulling the whole frontier into memory
+                capacity = self.max_workers * 2 - len(in_flight)
+                if max_pages is not None:
+                    capacity = min(capacity, max_pages - fetched - len(in_flight))
+                if capacity > 0:
+                    for row in state.claim(capacity):
+                        future = pool.submit(self.crawl_page, row['url'])
+                        in_flight[future] = (row['url'], row['depth'])
 
-    def get_page_content(self, url: str) -> str:
-        try:
-            if url in self.visited_urls:
-                return ""
-                
-            print(f"Fetching page: {url}")
-            time.sleep(self.delay)  # Be nice to the server
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            self.visited_urls.add(url)
-            return response.text
-        except Exception as e:
-            print(f"Error fetching page {url}: {str(e)}")
-            return ""
-
-    def extract_links(self, soup: BeautifulSoup, base_url: str) -> Set[str]:
-        """Extract all documentation links from the page."""
-        links = set()
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if href.endswith('.html'):
-                full_url = urljoin(base_url, href)
-                if full_url.startswith(self.base_url) and full_url not in self.visited_urls:
-                    links.add(full_url)
-        return links
+                if not in_flight:
+                    break
 
-    def parse_content(self, html_content: str, url: str) -> Dict[str, str]:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Extract title
-        title = soup.find('h1')
-        title_text = title.text.strip() if title else ""
-        
-        # Try different content divs
-        content_div = None
-        possible_content_divs = [
-            ('div', 'content'),
-            ('div', 'body'),
-            ('div', 'main-content'),
-            ('div', 'topic-content'),
-            ('div', 'section'),
-            ('article', None),
-            ('main', None)
-        ]
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = in_flight.pop(future)
+                    try:
+                        page_data, links = future.result()
+                    except Exception as e:
+                        print(f"Error fetching page {url}: {str(e)}")
+                        state.fail(url, CRAWL_MAX_ATTEMPTS)
+                        continue
 
-        for tag, class_name in possible_content_divs:
-            if class_name:
-                content_div = soup.find(tag, class_=class_name)
-            else:
-                content_div = soup.find(tag)
-            if content_div:
-                break
-
-        if not content_div:
-            content_div = soup.find('body')
-            if not content_div:
-                return {"title": title_text, "content": "", "url": url}
-
-        # Remove unwanted elements
-        for element in content_div.find_all(['script', 'style', 'nav', 'header', 'footer', 'aside']):
-            element.decompose()
-
-        # Get text content
-        content = content_div.get_text(separator='\n', strip=True)
-        
-        # Clean up content
-        content = re.sub(r'\n\s*\n', '\n\n', content)
-        content = re.sub(r'\s+', ' ', content)
-
-        return {
-            "title": title_text,
-            "content": content,
-            "url": url
-        }
-
-    def scrape_page(self, url: str) -> List[Dict[str, str]]:
-        """Scrape a single page and its linked pages recursively."""
-        pages = []
-        html_content = self.get_page_content(url)
-        
-        if not html_content:
-            return pages
-
-        # Parse current page
-        page_data = self.parse_content(html_content, url)
-        if page_data["content"]:
-            pages.append(page_data)
-            print(f"Successfully processed: {page_data['title']}")
-
-        # Extract and follow links
-        soup = BeautifulSoup(html_content, 'html.parser')
-        links = self.extract_links(soup, url)
-        
-        for link in links:
-            if link not in self.visited_urls:
-                linked_pages = self.scrape_page(link)
-                pages.extend(linked_pages)
+                    fetched += 1
+                    state.enqueue(links, depth + 1)
+                    state.complete(url, page_data if page_data["content"] else None)
+                    if page_data["content"]:
+                        print(f"Successfully processed: {page_data['title']}")
 
-        return pages
+        print(f"Crawl finished: {state.counts()}")
+        return state
 
-    def get_documentation_pages(self, save_to_file: bool = True, output_format: str = 'txt') -> List[Dict[str, str]]:
+    def get_documentation_pages(self, save_to_file: bool = True, output_format: str = 'txt', resume: bool = True) -> List[Dict[str, str]]:
         print("\nStarting to scrape NetSuite documentation...")
         print(f"Save to file: {save_to_file}")
         print(f"Output format: {output_format}")
         
         # Start with the main documentation page
-        main_url = f"{self.base_url}/set_N20140200.html"
-        pages = self.scrape_page(main_url)
+        main_url = urljoin(self.base_url, "set_N20140200.html")
+        state = self.crawl([main_url], resume=resume)
+        pages = list(state.iter_pages())
         
-        print(f"\nScraping complete. Processed {len(self.visited_urls)} unique pages.")
+        print(f"\nScraping complete. Processed {sum(state.counts().values())} unique pages.")
         print(f"Total content pages: {len(pages)}")
         
         if save_to_file and pages:
@@ -302,6 +249,18 @@ class NetSuiteScraper:
         print(f"Total content size: {sum(len(page['content']) for page in pages)} characters")
         return filename
 
+    def chunk_page(self, page: Dict[str, str], chunk_size: int = 1000) -> List[Dict[str, str]]:
+        """Split a page into chunks of ``chunk_size`` words."""
+        words = page["content"].split()
+        return [
+            {
+                "title": page["title"],
+                "content": " ".join(words[i:i + chunk_size]),
+                "url": page["url"]
+            }
+            for i in range(0, len(words), chunk_size)
+        ]
+
     def get_chunked_documentation(self, chunk_size: int = 1000) -> List[Dict[str, str]]:
         print("\nStarting to chunk documentation...")
         pages = self.get_documentation_pages()
@@ -309,16 +268,8 @@ class NetSuiteScraper:
         total_chunks = 0
 
         for page in pages:
-            content = page["content"]
-            words = content.split()
-            
-            for i in range(0, len(words), chunk_size):
-                chunk = " ".join(words[i:i + chunk_size])
-                chunks.append({
-                    "title": page["title"],
-                    "content": chunk,
-                    "url": page["url"]
-                })
+            for chunk in self.chunk_page(page, chunk_size):
+                chunks.append(chunk)
                 total_chunks += 1
                 if total_chunks % 10 == 0:
                     print(f"Created {total_chunks} chunks so far...")
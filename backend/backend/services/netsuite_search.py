@@ -1,59 +1,154 @@
-import requests
-from bs4 import BeautifulSoup
-import logging
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import List, Dict
-import re
-from urllib.parse import urljoin
 from langchain_community.utilities import SerpAPIWrapper
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
+from . import http_client
+from .html_extract import extract_page
+from .page_cache import page_cache
+from .search_cache import search_cache
+
+# Page fetches for one question run concurrently, bounded by this many workers
+FETCH_WORKERS = int(os.getenv("NETSUITE_FETCH_WORKERS", "5"))
+# Seconds allowed for a single page fetch
+PAGE_TIMEOUT = float(os.getenv("NETSUITE_PAGE_TIMEOUT", "5"))
+# Seconds allowed for fetching all pages of one search; late pages are dropped
+RETRIEVAL_DEADLINE = float(os.getenv("NETSUITE_RETRIEVAL_DEADLINE", "8"))
+
+SERPAPI_URL = "https://serpapi.com/search"
+
+# Shared so a deadline never has to wait for a per-call pool to shut down
+fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="netsuite-fetch")
 
 class NetSuiteSearch:
     def __init__(self, serpapi_api_key: str):
         self.search = SerpAPIWrapper(serpapi_api_key=serpapi_api_key)
         self.base_url = "https://docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/"
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        self.timeout = PAGE_TIMEOUT
+        self.retrieval_deadline = RETRIEVAL_DEADLINE
+        self.max_workers = FETCH_WORKERS
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len,
         )
 
+    def serp_params(self, search_query: str) -> Dict:
+        # Same parameters SerpAPIWrapper sends, so results match its own calls
+        return {**self.search.get_params(search_query), "source": "python", "output": "json"}
+
+    def serp_results(self, search_query: str) -> Dict:
+        """Query SerpAPI over the shared pooled session instead of a new connection per search."""
+        response = http_client.get(SERPAPI_URL, params=self.serp_params(search_query))
+        response.raise_for_status()
+        return response.json()
+
+    async def aserp_results(self, search_query: str) -> Dict:
+        """Async version of serp_results; SerpAPIWrapper.aresults opens a new aiohttp session per call."""
+        response = await http_client.aget(SERPAPI_URL, params=self.serp_params(search_query))
+        response.raise_for_status()
+        return response.json()
+
+    def build_search_query(self, query: str) -> str:
+        # Add site: filter to restrict search to NetSuite docs
+        return f"site:docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/ {query}"
+
+    def filter_results(self, results: Dict, num_results: int) -> List[Dict]:
+        """Keep the organic SerpAPI results that point into the NetSuite help center."""
+        organic_results = results.get('organic_results', [])[:num_results]
+        return [
+            result for result in organic_results
+            if 'link' in result and result['link'].startswith(self.base_url)
+        ]
+
+    def build_result(self, result: Dict, content: str) -> Dict[str, str]:
+        return {
+            "title": result.get('title', ''),
+            "url": result['link'],
+            "content": content,
+            "snippet": result.get('snippet', '')
+        }
+
+    def collect_results(self, results: List[Dict], contents: List[str]) -> List[Dict[str, str]]:
+        """Pair fetched contents with their results, keeping SerpAPI rank order."""
+        processed_results = []
+        for result, content in zip(results, contents):
+            if content is None:
+                print(f"⏱️ Dropped page that missed the retrieval deadline: {result['link']}")
+            elif content:
+                processed_results.append(self.build_result(result, content))
+        return processed_results
+
     def search_documentation(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
         """
         Search NetSuite documentation using SerpAPI and process the results.
-        
+
         Args:
             query: The search query
             num_results: Number of results to return
-            
+
         Returns:
             List of dictionaries containing processed documentation
         """
-        # Add site: filter to restrict search to NetSuite docs
-        search_query = f"site:docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/ {query}"
-        
+        search_query = self.build_search_query(query)
+
+        try:
+            # Get search results
+            results = search_cache.get_or_fetch(query, lambda: self.serp_results(search_query))
+            results = self.filter_results(results, num_results)
+
+            # Fetch and process the pages concurrently
+            futures = [fetch_executor.submit(self.get_page_content, result['link']) for result in results]
+            done, not_done = wait(futures, timeout=self.retrieval_deadline)
+            for future in not_done:
+                future.cancel()
+
+            contents = [future.result() if future in done else None for future in futures]
+            return self.collect_results(results, contents)
+
+        except Exception as e:
+            print(f"Error searching documentation: {str(e)}")
+            return []
+
+    async def asearch_documentation(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
+        """
+        Async version of search_documentation.
+
+        Args:
+            query: The search query
+            num_results: Number of results to return
+
+        Returns:
+            List of dictionaries containing processed documentation
+        """
+        search_query = self.build_search_query(query)
+
         try:
             # Get search results
-            results = self.search.results(search_query, num_results)
-            
-            processed_results = []
-            for result in results:
-                if 'link' in result and result['link'].startswith(self.base_url):
-                    # Fetch and process the page content
-                    content = self.get_page_content(result['link'])
-                    if content:
-                        processed_results.append({
-                            "title": result.get('title', ''),
-                            "url": result['link'],
-                            "content": content,
-                            "snippet": result.get('snippet', '')
-                        })
-            
-            return processed_results
-            
+            results = await search_cache.aget_or_fetch(query, lambda: self.aserp_results(search_query))
+            results = self.filter_results(results, num_results)
+            if not results:
+                return []
+
+            # Fetch and process the pages concurrently
+            semaphore = asyncio.Semaphore(self.max_workers)
+            async def fetch(url: str) -> str:
+                async with semaphore:
+                    return await asyncio.wait_for(self.aget_page_content(url), self.timeout)
+
+            tasks = [asyncio.create_task(fetch(result['link'])) for result in results]
+            done, pending = await asyncio.wait(tasks, timeout=self.retrieval_deadline)
+            for task in pending:
+                task.cancel()
+
+            contents = [
+                task.result() if task in done and not task.exception() else None
+                for task in tasks
+            ]
+            return self.collect_results(results, contents)
+
         except Exception as e:
             print(f"Error searching documentation: {str(e)}")
             return []
@@ -61,53 +156,88 @@ class NetSuiteSearch:
     def get_page_content(self, url: str) -> str:
         """Fetch and process a single documentation page."""
         try:
-            response = requests.get(url, headers=self.headers)
+            entry = page_cache.get(url)
+            if entry and page_cache.is_fresh(entry):
+                return entry["content"]
+
+            response = http_client.get(url, headers=page_cache.conditional_headers(entry),
+                                       timeout=http_client.default_timeout(self.timeout))
+            if response.status_code == 304 and entry:
+                page_cache.touch(url)
+                return entry["content"]
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract title
-            title = soup.find('h1')
-            title_text = title.text.strip() if title else ""
-            
-            # Try different content divs
-            content_div = None
-            possible_content_divs = [
-                ('div', 'content'),
-                ('div', 'body'),
-                ('div', 'main-content'),
-                ('div', 'topic-content'),
-                ('div', 'section'),
-                ('article', None),
-                ('main', None)
-            ]
+            return self.store_page_content(url, response.text, response.headers)
+
+        except Exception as e:
+            print(f"Error fetching page {url}: {str(e)}")
+            return ""
+
+    async def aget_page_content(self, url: str) -> str:
+        """Fetch a single documentation page without blocking the event loop."""
+        try:
+            entry = await asyncio.to_thread(page_cache.get, url)
+            if entry and page_cache.is_fresh(entry):
+                return entry["content"]
+
+            response = await http_client.aget(url, headers=page_cache.conditional_headers(entry),
+                                              timeout=http_client.default_timeout(self.timeout))
+            if response.status_code == 304 and entry:
+                await asyncio.to_thread(page_cache.touch, url)
+                return entry["content"]
+            response.raise_for_status()
+            # Parsing is CPU-bound, keep it off the event loop
+            return await asyncio.to_thread(self.store_page_content, url, response.text, response.headers)
 
-            for tag, class_name in possible_content_divs:
-                if class_name:
-                    content_div = soup.find(tag, class_=class_name)
-                else:
-                    content_div = soup.find(tag)
-                if content_div:
-                    break
-
-            if not content_div:
-                content_div = soup.find('body')
-                if not content_div:
-                    return ""
-
-            # Remove unwanted elements
-            for element in content_div.find_all(['script', 'style', 'nav', 'header', 'footer', 'aside']):
-                element.decompose()
-
-            # Get text content
-            content = content_div.get_text(separator='\n', strip=True)
-            
-            # Clean up content
-            content = re.sub(r'\n\s*\n', '\n\n', content)
-            content = re.sub(r'\s+', ' ', content)
-            
-            return content
-            
         except Exception as e:
             print(f"Error fetching page {url}: {str(e)}")
-            return "" 
\ No newline at end of file
+            return ""
+
+    def store_page_content(self, url: str, html_content: str, headers) -> str:
+        """Parse a freshly fetched page and cache its cleaned text."""
+        content = self.parse_page_content(html_content)
+        if content:
+            page_cache.put(url, content, headers.get("ETag"), headers.get("Last-Modified"))
+        return content
+
+    def parse_page_content(self, html_content: str) -> str:
+        """Extract the cleaned text content from a documentation page."""
+        return extract_page(html_content)["content"]
+
+    def get_chunked_documentation(self, query: str, chunk_size: int = 1000) -> List[Dict[str, str]]:
+        """
+        Search documentation and return chunked results.
+
+        Args:
+            query: The search query
+            chunk_size: Size of each chunk
+
+        Returns:
+            List of dictionaries containing chunked documentation
+        """
+        results = self.search_documentation(query)
+        chunks = []
+
+        for result in results:
+            # Create a Document object for the text splitter
+            doc = Document(
+                page_content=result["content"],
+                metadata={
+                    "title": result["title"],
+                    "url": result["url"],
+                    "snippet": result["snippet"]
+                }
+            )
+
+            # Split the document into chunks
+            doc_chunks = self.text_splitter.split_documents([doc])
+
+            # Convert chunks to the desired format
+            for chunk in doc_chunks:
+                chunks.append({
+                    "title": chunk.metadata["title"],
+                    "content": chunk.page_content,
+                    "url": chunk.metadata["url"],
+                    "snippet": chunk.metadata["snippet"]
+                })
+
+        return chunks
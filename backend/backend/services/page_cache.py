@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Cleaned page text lives in its own SQLite file next to rag_app.db
+PAGE_CACHE_DB = os.getenv("PAGE_CACHE_DB", "page_cache.db")
+# Seconds a cached page is served without asking the server again
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "86400"))
+# Pages kept on disk / in the in-process LRU layer
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "5000"))
+PAGE_CACHE_MEMORY_ENTRIES = int(os.getenv("PAGE_CACHE_MEMORY_ENTRIES", "500"))
+
+
+class PageCache:
+    """
+    Two-level cache of parsed documentation pages keyed by URL.
+
+    Entries are dicts with ``url``, ``content``, ``etag``, ``last_modified`` and
+    ``fetched_at``. Expired entries are still returned by ``get`` so the caller
+    can revalidate them with a conditional request instead of refetching.
+    """
+
+    def __init__(self, db_path: str = PAGE_CACHE_DB, ttl: int = PAGE_CACHE_TTL,
+                 max_entries: int = PAGE_CACHE_MAX_ENTRIES, memory_entries: int = PAGE_CACHE_MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "memory_hits": 0, "stale": 0, "misses": 0, "revalidated": 0, "stores": 0, "evictions": 0}
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS page_cache
+                             (url TEXT PRIMARY KEY,
+                              content TEXT,
+                              etag TEXT,
+                              last_modified TEXT,
+                              fetched_at REAL,
+                              last_accessed REAL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_page_cache_last_accessed ON page_cache (last_accessed)')
+        self.conn.commit()
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def conditional_headers(self, entry: Optional[Dict]) -> Dict[str, str]:
+        """Headers that let the server answer 304 if the cached page is unchanged."""
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self.lock:
+            entry = self.memory.get(url)
+            if entry is not None:
+                self.memory.move_to_end(url)
+                self.counters["memory_hits"] += 1
+            else:
+                row = self.conn.execute('SELECT url, content, etag, last_modified, fetched_at FROM page_cache WHERE url = ?',
+                                        (url,)).fetchone()
+                if row is None:
+                    self.counters["misses"] += 1
+                    return None
+                entry = dict(row)
+                self.conn.execute('UPDATE page_cache SET last_accessed = ? WHERE url = ?', (time.time(), url))
+                self.conn.commit()
+                self._remember(entry)
+
+            if self.is_fresh(entry):
+                self.counters["hits"] += 1
+            else:
+                self.counters["stale"] += 1
+            return entry
+
+    def put(self, url: str, content: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        now = time.time()
+        entry = {"url": url, "content": content, "etag": etag, "last_modified": last_modified, "fetched_at": now}
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO page_cache (url, content, etag, last_modified, fetched_at, last_accessed) '
+                              'VALUES (?, ?, ?, ?, ?, ?)', (url, content, etag, last_modified, now, now))
+            self.counters["stores"] += 1
+            self._evict()
+            self.conn.commit()
+            self._remember(entry)
+
+    def touch(self, url: str):
+        """Mark a cached page as fresh again after the server answered 304."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute('UPDATE page_cache SET fetched_at = ?, last_accessed = ? WHERE url = ?', (now, now, url))
+            self.conn.commit()
+            if url in self.memory:
+                self.memory[url]["fetched_at"] = now
+            self.counters["revalidated"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM page_cache')
+            self.conn.commit()
+            self.memory.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            entries = self.conn.execute('SELECT COUNT(*) FROM page_cache').fetchone()[0]
+            return {**self.counters, "entries": entries, "memory_entries": len(self.memory)}
+
+    def _remember(self, entry: Dict):
+        self.memory[entry["url"]] = entry
+        self.memory.move_to_end(entry["url"])
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict(self):
+        # Drop the least recently used pages once the disk cache is over size
+        count = self.conn.execute('SELECT COUNT(*) FROM page_cache').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            evicted = self.conn.execute('SELECT url FROM page_cache ORDER BY last_accessed ASC LIMIT ?', (overflow,)).fetchall()
+            self.conn.executemany('DELETE FROM page_cache WHERE url = ?', [(row["url"],) for row in evicted])
+            for row in evicted:
+                self.memory.pop(row["url"], None)
+            self.counters["evictions"] += len(evicted)
+
+
+page_cache = PageCache()
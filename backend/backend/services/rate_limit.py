@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket; acquire() blocks until enough tokens are available.
+
+    A request larger than the bucket waits for a full bucket and then takes
+    the bucket into debt. Later callers wait until the debt is refilled, so
+    oversized requests are charged in full and the long-run rate holds.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        # The bucket never holds more than its capacity, so that is all a large request can wait for
+        needed = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait_time = (needed - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def set_rate(self, rate: float):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class AdaptiveRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget for an API.
+
+    The allowed rate is halved whenever the API pushes back with a rate-limit
+    error and recovers gradually on success, never exceeding the configured budget.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 min_fraction: float = 0.05, recovery: float = 1.05):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_fraction = min_fraction
+        self.recovery = recovery
+        self.fraction = 1.0
+        self.lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60))
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 60)
+
+    def acquire(self, tokens: int):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+    def penalize(self):
+        self._scale(max(self.min_fraction, self.fraction / 2))
+
+    def reward(self):
+        if self.fraction < 1.0:
+            self._scale(min(1.0, self.fraction * self.recovery))
+
+    def _scale(self, fraction: float):
+        with self.lock:
+            self.fraction = fraction
+            self.requests.set_rate(self.requests_per_minute / 60 * fraction)
+            self.tokens.set_rate(self.tokens_per_minute / 60 * fraction)
@@ -0,0 +1,77 @@
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .bm25_index import tokenize
+
+# Deciding when a question needs the reformulation LLM call, and whether the
+# retrieval run on the raw question while it was reformulated can be reused.
+# Kept free of LangChain and vector store imports so it stays cheap to import
+# and test.
+
+# "adaptive" only reformulates questions that look like follow-ups, "always" reformulates whenever there is history
+REFORMULATION_MODE = os.getenv("REFORMULATION_MODE", "adaptive")
+# Questions this short are treated as follow-ups ("why?", "for vendors?")
+REFORMULATION_MIN_WORDS = int(os.getenv("REFORMULATION_MIN_WORDS", "4"))
+
+# Pronouns and markers that only make sense with an earlier turn. Words such as
+# "this", "that" or "there" are left out: they appear in most standalone questions
+CONTEXT_REFERENCES = {
+    "it", "its", "it's", "they", "them", "their", "theirs", "these", "those",
+    "same", "aforementioned", "above", "previous", "former", "latter", "again", "instead",
+}
+FOLLOW_UP_OPENERS = ("and ", "but ", "so ", "or ", "then ", "also ", "what about", "how about", "what if", "why not")
+
+WORD_PATTERN = re.compile(r"[a-z']+")
+
+
+def needs_reformulation(query: str, chat_history: List[Dict]) -> bool:
+    """
+    Cheap check for whether the question depends on the conversation.
+
+    Self-contained questions are answered without the reformulation LLM call;
+    anything that looks like a follow-up is still reformulated.
+    """
+    if not chat_history:
+        return False
+    if REFORMULATION_MODE == "always":
+        return True
+    text = query.strip().lower()
+    words = WORD_PATTERN.findall(text)
+    if len(words) < REFORMULATION_MIN_WORDS or text.startswith(FOLLOW_UP_OPENERS):
+        return True
+    return any(word in CONTEXT_REFERENCES for word in words)
+
+
+def same_question(a: str, b: str) -> bool:
+    return " ".join(a.lower().split()) == " ".join(b.lower().split())
+
+
+def reusable_speculation(question: str, speculative: Optional[Tuple[str, Tuple]]) -> Optional[Tuple]:
+    """
+    The speculative retrieval result, if it was run for ``question``.
+
+    Speculative retrieval runs on the raw user question while it is being
+    reformulated. When reformulation returned the question unchanged the
+    result stands as is; a rewritten question has to be rescored with
+    coverage_hits first.
+    """
+    if speculative and same_question(speculative[0], question):
+        return speculative[1]
+    return None
+
+
+def coverage_hits(question: str, docs: Sequence) -> List[Tuple[str, float, float]]:
+    """
+    Score already retrieved documents against ``question`` without another search.
+
+    Returns ``(doc id, 0.0, fraction of the question's terms the document
+    contains)`` in the shape of BM25Index.search hits, best covered first, so
+    the speculative results can be checked against the reformulated question
+    with match_strength.
+    """
+    terms = set(tokenize(question))
+    if not terms:
+        return []
+    hits = [(doc.id, 0.0, len(terms.intersection(tokenize(doc.page_content or ""))) / len(terms)) for doc in docs]
+    return sorted(hits, key=lambda hit: hit[2], reverse=True)
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict
+
+# Seconds a SerpAPI response is served as fresh
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "3600"))
+# Seconds past the TTL a stale response may still be served while it refreshes
+SEARCH_CACHE_MAX_STALE = int(os.getenv("SEARCH_CACHE_MAX_STALE", "86400"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+SEARCH_CACHE_SERVE_STALE = os.getenv("SEARCH_CACHE_SERVE_STALE", "true").lower() == "true"
+
+STOPWORDS = frozenset("""
+a about an and are as at be by can could do does for from how i if in into is it me my of on or please
+should show tell that the their there these this to using was what when where which who why will with
+would you your
+""".split())
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a question into a cache key.
+
+    Case-folds, collapses whitespace and drops stopwords. Tokens keep ``.``,
+    ``/``, ``_`` and ``-`` so identifiers like ``N/record`` or
+    ``custbody_approval`` survive intact.
+    """
+    tokens = re.findall(r"[\w./-]+", query.casefold())
+    kept = [token for token in tokens if token not in STOPWORDS]
+    # A question made only of stopwords still needs a distinct key
+    return " ".join(kept or tokens)
+
+
+class SearchCache:
+    """In-process TTL/LRU cache of raw SerpAPI responses keyed by normalized query."""
+
+    def __init__(self, ttl: int = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+                 serve_stale: bool = SEARCH_CACHE_SERVE_STALE, max_stale: int = SEARCH_CACHE_MAX_STALE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.serve_stale = serve_stale
+        self.max_stale = max_stale
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-cache-refresh")
+        self.refresh_tasks = set()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "evictions": 0}
+
+    def get_or_fetch(self, query: str, fetch: Callable[[], Dict]) -> Dict:
+        """Return cached results for ``query``, calling ``fetch`` on a miss."""
+        key = normalize_query(query)
+        results, state = self._lookup(key)
+        if state == "fresh":
+            return results
+        if state == "stale":
+            if self._claim_refresh(key):
+                self.refresh_executor.submit(self._refresh, key, fetch)
+            return results
+
+        results = fetch()
+        self._store(key, results)
+        return results
+
+    async def aget_or_fetch(self, query: str, afetch: Callable[[], Awaitable[Dict]]) -> Dict:
+        """Async version of get_or_fetch."""
+        key = normalize_query(query)
+        results, state = self._lookup(key)
+        if state == "fresh":
+            return results
+        if state == "stale":
+            if self._claim_refresh(key):
+                task = asyncio.create_task(self._arefresh(key, afetch))
+                # Hold a reference so the task is not garbage collected mid-flight
+                self.refresh_tasks.add(task)
+                task.add_done_callback(self.refresh_tasks.discard)
+            return results
+
+        results = await afetch()
+        self._store(key, results)
+        return results
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {**self.counters, "entries": len(self.entries)}
+
+    def _lookup(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None, "miss"
+
+            age = time.time() - entry["stored_at"]
+            if age < self.ttl:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry["results"], "fresh"
+            if self.serve_stale and age < self.ttl + self.max_stale:
+                self.entries.move_to_end(key)
+                self.counters["stale_hits"] += 1
+                return entry["results"], "stale"
+
+            del self.entries[key]
+            self.counters["misses"] += 1
+            return None, "miss"
+
+    def _store(self, key: str, results: Dict):
+        # Never cache SerpAPI error payloads
+        if not isinstance(results, dict) or "error" in results:
+            return
+        with self.lock:
+            self.entries[key] = {"results": results, "stored_at": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def _claim_refresh(self, key: str) -> bool:
+        # Only one background refresh per key at a time
+        with self.lock:
+            if key in self.refreshing:
+                return False
+            self.refreshing.add(key)
+            return True
+
+    def _refresh(self, key: str, fetch: Callable[[], Dict]):
+        try:
+            self._store(key, fetch())
+            self.counters["refreshes"] += 1
+        except Exception as e:
+            print(f"Error refreshing cached search for '{key}': {str(e)}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    async def _arefresh(self, key: str, afetch: Callable[[], Awaitable[Dict]]):
+        try:
+            self._store(key, await afetch())
+            self.counters["refreshes"] += 1
+        except Exception as e:
+            print(f"Error refreshing cached search for '{key}': {str(e)}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+
+search_cache = SearchCache()
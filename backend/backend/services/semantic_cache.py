@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from langchain_chroma import Chroma
+
+from .database import get_index_generation
+from .vector_store_db import embedding_function
+
+# Minimum relevance between two reformulated questions to reuse an answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers keyed by the embedding of the reformulated question.
+
+    Entries live in their own Chroma collection and are partitioned by model.
+    Each entry records the index generation it was answered from, so re-indexing
+    the documentation makes every older answer unreachable.
+    """
+
+    def __init__(self, store: Chroma, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: int = SEMANTIC_CACHE_TTL):
+        self.store = store
+        self.threshold = threshold
+        self.ttl = ttl
+        self.purged_generation = None
+        self.purged_at = 0.0
+        self.counters = {"hits": 0, "misses": 0, "stores": 0}
+
+    def build_filter(self, model: str, generation: int) -> Dict:
+        return {"$and": [
+            {"model": model},
+            {"generation": generation},
+            {"created_at": {"$gte": time.time() - self.ttl}}
+        ]}
+
+    def lookup(self, question: str, model: str) -> Optional[Dict]:
+        """Return the cached answer for a similar question, or None."""
+        if not SEMANTIC_CACHE_ENABLED:
+            return None
+        try:
+            results = self.store.similarity_search_with_relevance_scores(
+                question, k=1, filter=self.build_filter(model, get_index_generation())
+            )
+            return self.to_hit(results)
+        except Exception as e:
+            print(f"Error looking up semantic cache: {str(e)}")
+            return None
+
+    async def alookup(self, question: str, model: str) -> Optional[Dict]:
+        if not SEMANTIC_CACHE_ENABLED:
+            return None
+        try:
+            generation = await asyncio.to_thread(get_index_generation)
+            results = await self.store.asimilarity_search_with_relevance_scores(
+                question, k=1, filter=self.build_filter(model, generation)
+            )
+            return self.to_hit(results)
+        except Exception as e:
+            print(f"Error looking up semantic cache: {str(e)}")
+            return None
+
+    def save(self, question: str, model: str, answer: str, sources: List[Dict], retrieval_source: str):
+        """Store a generated answer with the sources it was built from."""
+        if not SEMANTIC_CACHE_ENABLED:
+            return
+        try:
+            generation = get_index_generation()
+            self.purge(generation)
+            self.store.add_texts(
+                texts=[question],
+                metadatas=[{
+                    "model": model,
+                    "answer": answer,
+                    "sources": json.dumps(sources),
+                    "retrieval_source": retrieval_source,
+                    "generation": generation,
+                    "created_at": time.time()
+                }],
+                ids=[str(uuid.uuid4())]
+            )
+            self.counters["stores"] += 1
+        except Exception as e:
+            print(f"Error saving to semantic cache: {str(e)}")
+
+    async def asave(self, question: str, model: str, answer: str, sources: List[Dict], retrieval_source: str):
+        await asyncio.to_thread(self.save, question, model, answer, sources, retrieval_source)
+
+    def purge(self, generation: int):
+        """Delete answers from older index generations or past their TTL."""
+        if self.purged_generation == generation and time.time() - self.purged_at < self.ttl:
+            return
+        self.store._collection.delete(where={"$or": [
+            {"generation": {"$ne": generation}},
+            {"created_at": {"$lt": time.time() - self.ttl}}
+        ]})
+        self.purged_generation = generation
+        self.purged_at = time.time()
+
+    def clear(self):
+        self.store.reset_collection()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "entries": self.store._collection.count()}
+
+    def to_hit(self, results) -> Optional[Dict]:
+        if not results or results[0][1] < self.threshold:
+            self.counters["misses"] += 1
+            return None
+        doc, score = results[0]
+        self.counters["hits"] += 1
+        print(f"🎯 Semantic cache hit ({score:.3f}) for: {doc.page_content}")
+        return {
+            "answer": doc.metadata["answer"],
+            "sources": json.loads(doc.metadata["sources"]),
+            "retrieval_source": doc.metadata["retrieval_source"],
+            "score": score
+        }
+
+
+answer_cache = SemanticAnswerCache(
+    Chroma(
+        collection_name="answer_cache",
+        persist_directory="./chroma_db",
+        embedding_function=embedding_function,
+        # Cosine space makes relevance scores plain cosine similarity
+        collection_metadata={"hnsw:space": "cosine"}
+    )
+)
@@ -1,26 +1,30 @@
-from langchain_community.document_loaders import  (
-    PyPDFLoader,
-    Docx2txtLoader,
-    UnstructuredHTMLLoader,
-    TextLoader,
-    UnstructuredCSVLoader,
-    UnstructuredExcelLoader
-
-)
-
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 
 
 from langchain_chroma import Chroma
-from typing import List, Dict
-from langchain_core.documents import Document
+from typing import Callable, Dict, Iterable, List, Optional
 import os
 
 
 from dotenv import load_dotenv
 from .netsuite_scraper import NetSuiteScraper
+from .bm25_index import BM25Index
+from .embedding_pipeline import EmbeddingPipeline, chroma_writer
+from .embedding_cache import CachedEmbeddings, embedding_cache
+from .document_loader import iter_document_splits
+from .chunk_ids import content_hash, chunk_id_for, legacy_doc_chunk_ids
+from .database import (
+    bump_index_generation,
+    get_index_metadata,
+    set_index_metadata,
+    get_indexed_page_hashes,
+    get_indexed_chunk_hashes,
+    save_indexed_page,
+    delete_indexed_page,
+    clear_index_tracking)
+from urllib.parse import urljoin
 import logging
+import uuid
 
 # Load environment variables from .env file
 load_dotenv()
@@ -36,9 +40,17 @@ print("OPENAI_API_KEY:",OPENAI_API_KEY)
 EMBEDDING_MODEL = "nomic-embed-text"
 
 
-# Initialize text splitter and embedding function
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
-embedding_function = OpenAIEmbeddings()
+# Initialize embedding function
+# Point EMBEDDINGS_BASE_URL at a local fake embeddings server to exercise bulk
+# indexing without the OpenAI API; such servers take raw strings, not token ids
+EMBEDDINGS_BASE_URL = os.getenv("EMBEDDINGS_BASE_URL")
+if EMBEDDINGS_BASE_URL:
+    embedding_function = OpenAIEmbeddings(base_url=EMBEDDINGS_BASE_URL, check_embedding_ctx_length=False)
+else:
+    embedding_function = OpenAIEmbeddings()
+# Identical texts (repeated boilerplate chunks, re-uploaded files, the question
+# embedded for retrieval and again for the semantic cache) are embedded once
+embedding_function = CachedEmbeddings(embedding_function, embedding_cache)
 
 # Initialize Chroma vector store
 vectorstore = Chroma(
@@ -47,39 +59,90 @@ vectorstore = Chroma(
     embedding_function=embedding_function
 )
 
+# Lexical index over the NetSuite documentation chunks, kept next to the Chroma
+# collection and keyed by the same chunk ids
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "./chroma_db/netsuite_docs_bm25.pkl")
+bm25_index = BM25Index(BM25_INDEX_PATH)
+# Chunks sent to the vector store per write while indexing the documentation
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "2048"))
 
-def load_and_split_document(file_path: str) -> List[Document]:
-    if file_path.endswith('.pdf'):
-        loader = PyPDFLoader(file_path)
-    elif file_path.endswith('.docx'):
-        loader = Docx2txtLoader(file_path)
-    elif file_path.endswith('.html'):
-        loader = UnstructuredHTMLLoader(file_path)
-    elif file_path.endswith('.txt'):
-        loader = TextLoader(file_path, encoding='UTF-8')
-    elif file_path.endswith('.csv'):
-        loader = UnstructuredCSVLoader(file_path,mode="elements")
-    elif file_path.endswith('.xlsx') or file_path.endswith('.xls'):
-        loader = UnstructuredExcelLoader(file_path,mode="elements")
-    else:
-        raise ValueError(f"Unsupported file type: {file_path}")
 
-    documents = loader.load()
-    return text_splitter.split_documents(documents)
+def embed_and_store(items: Iterable[Dict], label: str = "chunks",
+                    on_progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Embed chunks through the batched pipeline and upsert them into Chroma."""
+    return EmbeddingPipeline(embedding_function, chroma_writer(vectorstore),
+                             label=label, on_progress=on_progress).run(items)
 
 
+def rebuild_bm25_index(batch_size: int = 5000) -> int:
+    """Rebuild the BM25 index from the NetSuite chunks already stored in Chroma."""
+    bm25_index.reset()
+    offset = 0
+    while True:
+        batch = vectorstore.get(
+            where={"source": "netsuite_docs"},
+            include=["documents"],
+            limit=batch_size,
+            offset=offset
+        )
+        if not batch["ids"]:
+            break
+        bm25_index.add(batch["ids"], batch["documents"])
+        offset += len(batch["ids"])
+    bm25_index.save()
+    print(f"Rebuilt BM25 index with {len(bm25_index)} chunks")
+    return len(bm25_index)
 
-def index_document_to_chroma(file_path: str, file_id: int,user_id:int) -> bool:
+
+def load_bm25_index():
     try:
-        splits = load_and_split_document(file_path)
+        if not bm25_index.load():
+            rebuild_bm25_index()
+    except Exception as e:
+        logging.error(f"Error loading BM25 index: {str(e)}")
+
+
+load_bm25_index()
+
+
+def delete_document_chunks(file_id: int, user_id: int):
+    vectorstore._collection.delete(where={"$and": [{"file_id": file_id}, {"user_id": user_id}]})
+
+
+def ingest_document(file_path: str, file_id: int, user_id: int,
+                    on_progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Stream a file into the vector store and return the pipeline stats.
+
+    Pages are loaded, split, embedded and written in bounded batches, so peak
+    memory does not grow with the file. Chunks left by an interrupted earlier
+    attempt are removed first, and a failure part way through removes the
+    chunks already written before the error is re-raised.
+    """
+    delete_document_chunks(file_id, user_id)
 
-        # Add metadata to each split
-        for split in splits:
+    def items():
+        for split in iter_document_splits(file_path):
+            # Add metadata to each split
             split.metadata['file_id'] = file_id
             split.metadata['user_id'] = user_id
+            yield {"id": str(uuid.uuid4()), "text": split.page_content, "metadata": split.metadata}
+
+    try:
+        stats = embed_and_store(items(), label=os.path.basename(file_path), on_progress=on_progress)
+    except Exception:
+        try:
+            delete_document_chunks(file_id, user_id)
+        except Exception as cleanup_error:
+            print(f"Error removing partial chunks for file_id {file_id}: {str(cleanup_error)}")
+        raise
+    print(f"Indexed {stats['chunks']} chunks from {file_path} in {stats['seconds']}s")
+    return stats
 
-        vectorstore.add_documents(splits)
 
+def index_document_to_chroma(file_path: str, file_id: int,user_id:int) -> bool:
+    try:
+        ingest_document(file_path, file_id, user_id)
         return True
     except Exception as e:
         print(f"Error indexing document: {e}")
@@ -99,39 +162,127 @@ def delete_doc_from_chroma(file_id: int,user_id:int):
         print(f"Error deleting document with file_id {file_id} from Chroma: {str(e)}")
         return False
 
-def index_netsuite_docs():
-    """Index NetSuite documentation into the vector store"""
+def remove_legacy_doc_chunks() -> int:
+    """
+    Delete documentation chunks indexed before chunk ids were derived from the
+    URL; the incremental index replaces them. Returns how many were deleted.
+    """
+    legacy_ids = legacy_doc_chunk_ids(vectorstore)
+    for start in range(0, len(legacy_ids), INDEX_BATCH_SIZE):
+        batch = legacy_ids[start:start + INDEX_BATCH_SIZE]
+        vectorstore.delete(ids=batch)
+        bm25_index.delete(batch)
+    if legacy_ids:
+        print(f"Removed {len(legacy_ids)} documentation chunks from before incremental indexing")
+    return len(legacy_ids)
+
+
+def index_netsuite_docs(resume: bool = True):
+    """
+    Incrementally index NetSuite documentation into the vector store.
+
+    Pages whose content hash is unchanged are skipped, changed chunks are
+    replaced and chunks past a page's new end are deleted. Pages missing from
+    a complete crawl are removed; after a crawl with failures only pages that
+    now return 404/410 are. The first complete crawl also removes chunks left
+    by the indexer before chunk ids were stable. Returns the number of chunks
+    embedded.
+    """
     try:
         print("\nStarting to index NetSuite documentation into vector store...")
         scraper = NetSuiteScraper()
-        chunks = scraper.get_chunked_documentation()
+        main_url = urljoin(scraper.base_url, "set_N20140200.html")
+        state = scraper.crawl([main_url], resume=resume)
         
-        # Prepare documents for indexing
-        documents = []
-        metadatas = []
+        # Only a crawl that reached every page it found can show that a page is gone;
+        # a failed seed or index page hides everything below it
+        counts = state.counts()
+        has_pages = next(state.iter_pages(), None) is not None
+        crawl_complete = has_pages and not counts.get("failed") and not state.has_unfinished()
+        if not crawl_complete:
+            print(f"⚠️ Crawl incomplete ({counts}); only pages confirmed gone will be removed")
         
-        print("\nPreparing documents for indexing...")
-        for chunk in chunks:
-            documents.append(chunk["content"])
-            metadatas.append({
-                "title": chunk["title"],
-                "url": chunk["url"]
-            })
+        page_hashes = get_indexed_page_hashes()
         
-        print(f"\nIndexing {len(documents)} chunks into vector store...")
-        # Add documents to Chroma
-        vectorstore.add_texts(
-            texts=documents,
-            metadatas=metadatas
-        )
+        stats = {"pages": 0, "unchanged_pages": 0, "embedded": 0, "unchanged_chunks": 0, "deleted": 0, "removed_pages": 0}
+        pending_pages = []
+        pending_chunks = []
+        seen_urls = set()
+        
+        def flush():
+            if pending_chunks:
+                embed_and_store([
+                    {"id": chunk["id"], "text": chunk["content"], "metadata": chunk["metadata"]}
+                    for chunk in pending_chunks
+                ], label="netsuite_docs")
+                bm25_index.add([chunk["id"] for chunk in pending_chunks], [chunk["content"] for chunk in pending_chunks])
+            for page in pending_pages:
+                if page["stale_ids"]:
+                    vectorstore.delete(ids=page["stale_ids"])
+                    bm25_index.delete(page["stale_ids"])
+                save_indexed_page(page["url"], page["page_hash"], page["chunks"])
+            stats["embedded"] += len(pending_chunks)
+            pending_pages.clear()
+            pending_chunks.clear()
+        
+        print("\nComparing pages against the index...")
+        for page in state.iter_pages():
+            url = page["url"]
+            seen_urls.add(url)
+            stats["pages"] += 1
+            page_hash = content_hash(page["title"], page["content"])
+            if page_hashes.get(url) == page_hash:
+                stats["unchanged_pages"] += 1
+                continue
+            
+            existing = get_indexed_chunk_hashes(url)
+            chunk_records = []
+            for chunk_index, chunk in enumerate(scraper.chunk_page(page)):
+                chunk_id = chunk_id_for(url, chunk_index)
+                chunk_hash = content_hash(chunk["title"], chunk["content"])
+                chunk_records.append((chunk_id, chunk_index, chunk_hash))
+                if existing.get(chunk_id) == chunk_hash:
+                    stats["unchanged_chunks"] += 1
+                    continue
+                pending_chunks.append({
+                    "id": chunk_id,
+                    "content": chunk["content"],
+                    "metadata": {"title": chunk["title"], "url": url, "source": "netsuite_docs"}
+                })
+            
+            new_ids = {chunk_id for chunk_id, _, _ in chunk_records}
+            stale_ids = [chunk_id for chunk_id in existing if chunk_id not in new_ids]
+            stats["deleted"] += len(stale_ids)
+            pending_pages.append({"url": url, "page_hash": page_hash, "chunks": chunk_records, "stale_ids": stale_ids})
+            
+            if len(pending_chunks) >= INDEX_BATCH_SIZE:
+                flush()
+        flush()
         
-        # Persist the database
-        print("Persisting vector store...")
-        # The persistence is now handled automatically by ChromaDB
-        # No need to call persist() explicitly
+        removed_urls = [url for url in page_hashes if url not in seen_urls]
+        if removed_urls and not crawl_complete:
+            removed_urls = scraper.confirm_gone(removed_urls)
+        for url in removed_urls:
+            removed_ids = delete_indexed_page(url)
+            if removed_ids:
+                vectorstore.delete(ids=removed_ids)
+                bm25_index.delete(removed_ids)
+            stats["deleted"] += len(removed_ids)
+            stats["removed_pages"] += 1
         
-        print(f"\nSuccessfully indexed {len(documents)} chunks into vector store!")
-        return len(documents)
+        # Chunks indexed before chunk ids were stable duplicate the pages just
+        # indexed; drop them once, after a crawl that re-indexed every page
+        if crawl_complete and not get_index_metadata("legacy_chunks_removed"):
+            stats["deleted"] += remove_legacy_doc_chunks()
+            set_index_metadata("legacy_chunks_removed", "1")
+        
+        bm25_index.save()
+        if stats["embedded"] or stats["deleted"]:
+            # Answers cached against the previous index are no longer valid
+            bump_index_generation()
+        
+        print(f"\nIncremental indexing complete: {stats}")
+        return stats["embedded"]
     except Exception as e:
         print(f"Error indexing NetSuite docs: {str(e)}")
         return 0
@@ -156,11 +307,12 @@ def get_relevant_docs(query: str, k: int = 4) -> List[Dict]:
 def clear_vector_store():
     """Clear all documents from the vector store"""
     try:
-        vectorstore.delete_collection()
-        vectorstore = Chroma(
-            persist_directory="./chroma_db",
-            embedding_function=embedding_function
-        )
+        # Recreate the collection in place so every module holding `vectorstore` stays valid
+        vectorstore.reset_collection()
+        bm25_index.reset()
+        bm25_index.save()
+        clear_index_tracking()
+        bump_index_generation()
         return True
     except Exception as e:
         logging.error(f"Error clearing vector store: {str(e)}")
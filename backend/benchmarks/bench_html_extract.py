@@ -0,0 +1,202 @@
+"""
+Benchmark HTML-to-text extraction on NetSuite help pages.
+
+Compares every installed html_extract backend against the previous
+BeautifulSoup implementation (html.parser, probing containers one find at a
+time, two regex passes, and a second parse for links) and checks that each
+backend extracts the same content.
+
+Pages are not committed. Either download real ones with --save, or use
+--generate for synthetic help-style pages (chrome, nested sections, tables,
+code samples and links, seeded so every run gets the same pages). Timings on
+generated pages are synthetic; check them against saved real pages before
+quoting them.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_html_extract --save https://docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/set_N20140200.html
+    python -m benchmarks.bench_html_extract --generate 40
+    python -m benchmarks.bench_html_extract benchmarks/pages
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import time
+from typing import Dict, List
+from urllib.parse import urldefrag, urljoin
+
+from backend.services.html_extract import BACKENDS, CONTENT_CONTAINERS, extract_page
+
+DOCS_PREFIX = "https://docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/"
+DEFAULT_PAGES_DIR = os.path.join(os.path.dirname(__file__), "pages")
+
+
+def legacy_extract(html: str, url: str) -> Dict:
+    """The extraction as it was before html_extract, kept here as the baseline."""
+    from bs4 import BeautifulSoup
+
+    link_soup = BeautifulSoup(html, 'html.parser')
+    links = set()
+    for link in link_soup.find_all('a', href=True):
+        full_url = urldefrag(urljoin(url, link['href']))[0]
+        if full_url.endswith('.html') and full_url.startswith(DOCS_PREFIX):
+            links.add(full_url)
+
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.find('h1')
+    title_text = title.text.strip() if title else ""
+    content_div = None
+    for tag, class_name in CONTENT_CONTAINERS:
+        content_div = soup.find(tag, class_=class_name) if class_name else soup.find(tag)
+        if content_div:
+            break
+    if not content_div:
+        content_div = soup.find('body')
+        if not content_div:
+            return {"title": title_text, "content": "", "links": links}
+    for element in content_div.find_all(['script', 'style', 'nav', 'header', 'footer', 'aside']):
+        element.decompose()
+    content = content_div.get_text(separator='\n', strip=True)
+    content = re.sub(r'\n\s*\n', '\n\n', content)
+    content = re.sub(r'\s+', ' ', content)
+    return {"title": title_text, "content": content, "links": links}
+
+
+def save_pages(urls: List[str], pages_dir: str):
+    from backend.services import http_client
+
+    os.makedirs(pages_dir, exist_ok=True)
+    for url in urls:
+        response = http_client.get(url)
+        response.raise_for_status()
+        name = url.rstrip('/').rsplit('/', 1)[-1] or "index.html"
+        with open(os.path.join(pages_dir, name), 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"Saved {url}")
+
+
+WORDS = ("record transaction invoice vendor customer subsidiary approval workflow saved search role "
+         "permission field sublist script deployment suitelet restlet scheduled map reduce currency "
+         "period journal item fulfillment bill payment account department class location form").split()
+
+
+def generate_page(rng: random.Random, number: int) -> str:
+    """A synthetic page shaped like a NetSuite help topic: site chrome around a div.content article."""
+    def words(low: int, high: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+    def link(text: str) -> str:
+        topic = f"section_N{rng.randint(1000000, 9999999)}.html"
+        href = rng.choice([topic, DOCS_PREFIX + topic, f"/en/cloud/saas/netsuite/ns-online-help/{topic}#bridgehead",
+                           "https://www.oracle.com/index.html", "../other/book.pdf"])
+        return f"<a href='{href}'>{text}</a>"
+
+    nav = "".join(f"<li>{link(words(2, 3))}</li>" for _ in range(rng.randint(40, 80)))
+    body = [f"<h1>{words(3, 6).title()}</h1>", f"<p class='shortdesc'>{words(20, 40)}</p>"]
+    for _ in range(rng.randint(4, 9)):
+        body.append(f"<div class='section'><h2>{words(2, 5).title()}</h2>")
+        for _ in range(rng.randint(2, 6)):
+            body.append(f"<p>{words(30, 80)} {link(words(1, 3))} {words(10, 30)}.</p>")
+        if rng.random() < 0.5:
+            rows = "".join(f"<tr><td><code>{rng.choice(WORDS)}_{rng.randint(1, 99)}</code></td><td>{words(5, 15)}</td></tr>"
+                           for _ in range(rng.randint(3, 12)))
+            body.append(f"<table><thead><tr><th>Field</th><th>Description</th></tr></thead><tbody>{rows}</tbody></table>")
+        if rng.random() < 0.4:
+            code = "\n".join(f"    record.setValue({{ fieldId: '{rng.choice(WORDS)}', value: {rng.randint(1, 999)} }});"
+                              for _ in range(rng.randint(3, 10)))
+            body.append(f"<pre class='codeblock'><code>{code}</code></pre>")
+        if rng.random() < 0.5:
+            items = "".join(f"<li>{words(5, 20)}</li>" for _ in range(rng.randint(2, 8)))
+            body.append(f"<h3>{words(2, 4).title()}</h3><ul>{items}</ul>")
+        body.append(f"<!-- topic {number} section --><aside class='note'>{words(10, 20)}</aside></div>")
+    related = "".join(f"<li>{link(words(2, 4))}</li>" for _ in range(rng.randint(5, 15)))
+    return (
+        "<!DOCTYPE html><html lang='en'><head><meta charset='utf-8'>"
+        f"<title>{words(3, 6)}</title><style>.content {{ margin: 0 }}</style>"
+        "<script src='/sp_common/book-template/ohc-common.js'></script></head><body>"
+        f"<header><div class='brand'>Oracle NetSuite</div></header><nav><ul>{nav}</ul></nav>"
+        f"<div class='content'>{''.join(body)}<h2>Related Topics</h2><ul>{related}</ul></div>"
+        f"<footer>{words(10, 20)}<script>window.analytics = {{ page: {number} }};</script></footer>"
+        "</body></html>"
+    )
+
+
+def generate_pages(count: int, pages_dir: str, seed: int = 0):
+    rng = random.Random(seed)
+    os.makedirs(pages_dir, exist_ok=True)
+    for number in range(count):
+        with open(os.path.join(pages_dir, f"generated_{number:03d}.html"), 'w', encoding='utf-8') as f:
+            f.write(generate_page(rng, number))
+    print(f"Generated {count} synthetic pages in {pages_dir}")
+
+
+def load_pages(paths: List[str]) -> List[Dict[str, str]]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(('.html', '.htm')))
+        else:
+            files.append(path)
+    pages = []
+    for file in files:
+        with open(file, encoding='utf-8', errors='replace') as f:
+            pages.append({"url": urljoin(DOCS_PREFIX, os.path.basename(file)), "html": f.read()})
+    return pages
+
+
+def time_backend(extract, pages: List[Dict[str, str]], repeat: int) -> float:
+    """Best-of-``repeat`` seconds to extract every page."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            extract(page)
+        runs.append(time.perf_counter() - start)
+    return min(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML extraction backends")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_PAGES_DIR], help="Saved HTML pages or directories of them")
+    parser.add_argument("--save", nargs="+", metavar="URL", help=f"Download pages into {DEFAULT_PAGES_DIR} first")
+    parser.add_argument("--generate", type=int, metavar="N", help=f"Write N synthetic pages into {DEFAULT_PAGES_DIR} first")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for --generate")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per backend; the fastest is reported")
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.save, DEFAULT_PAGES_DIR)
+    if args.generate:
+        generate_pages(args.generate, DEFAULT_PAGES_DIR, args.seed)
+    pages = load_pages([path for path in args.paths if os.path.exists(path)])
+    if not pages:
+        print("No saved pages found; pass HTML files, use --save URL to download some or --generate N to create some")
+        return
+    size_mb = sum(len(page["html"]) for page in pages) / 1e6
+    synthetic = sum(os.path.basename(page["url"]).startswith("generated_") for page in pages)
+    print(f"{len(pages)} pages ({synthetic} synthetic), {size_mb:.1f} MB of HTML, best of {args.repeat} runs\n")
+
+    baseline = {page["url"]: legacy_extract(page["html"], page["url"]) for page in pages}
+    legacy_seconds = time_backend(lambda page: legacy_extract(page["html"], page["url"]), pages, args.repeat)
+    print(f"{'backend':<12}{'ms/page':>10}{'speedup':>10}{'same content':>15}{'same links':>13}")
+    print(f"{'legacy':<12}{legacy_seconds / len(pages) * 1000:>10.2f}{1.0:>9.1f}x{'-':>15}{'-':>13}")
+
+    for name in BACKENDS:
+        seconds = time_backend(lambda page: extract_page(page["html"], page["url"], DOCS_PREFIX, backend=name),
+                               pages, args.repeat)
+        same_content = same_links = 0
+        for page in pages:
+            result = extract_page(page["html"], page["url"], DOCS_PREFIX, backend=name)
+            same_content += result["content"] == baseline[page["url"]]["content"]
+            same_links += set(result["links"]) == baseline[page["url"]]["links"]
+        print(f"{name:<12}{seconds / len(pages) * 1000:>10.2f}{legacy_seconds / seconds:>9.1f}x"
+              f"{same_content:>11}/{len(pages):<3}{same_links:>9}/{len(pages):<3}")
+
+    lengths = [len(baseline[page["url"]]["content"]) for page in pages]
+    print(f"\nMedian extracted content: {statistics.median(lengths):.0f} characters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+
+from backend.services.bm25_index import BM25Index
+
+
+def test_replaced_chunks_do_not_count_towards_document_frequency(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.pkl"), compact_ratio=1.0)
+    index.add(["a", "b"], ["invoice approval workflow", "vendor bill"])
+    fresh = BM25Index(str(tmp_path / "fresh.pkl"))
+    fresh.add(["a", "b"], ["sales order", "vendor bill"])
+
+    index.add(["a"], ["sales order"])
+
+    assert index.deleted == 1
+    assert index.search("vendor") == fresh.search("vendor")
+    assert index.search("invoice") == []
+
+
+def test_replacements_trigger_compaction(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.pkl"), compact_ratio=0.25)
+    index.add(["a", "b", "c"], ["saved search", "sales order", "vendor bill"])
+
+    index.add(["a", "b"], ["saved search criteria", "sales order lines"])
+
+    assert index.deleted == 0
+    assert len(index.doc_ids) == 3
+    assert index.search("criteria")[0][0] == "a"
+
+
+def test_search_reloads_an_index_rewritten_by_another_process(tmp_path):
+    path = str(tmp_path / "bm25.pkl")
+    writer = BM25Index(path)
+    writer.add(["a"], ["saved search"])
+    writer.save()
+    reader = BM25Index(path)
+    assert reader.load()
+
+    writer.add(["b"], ["vendor bill"])
+    writer.save()
+    stat = os.stat(path)
+    # Make sure the rewrite is visible even on filesystems with coarse mtimes
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert [hit[0] for hit in reader.search("vendor")] == ["b"]
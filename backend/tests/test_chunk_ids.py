@@ -0,0 +1,37 @@
+import uuid
+
+from backend.services.chunk_ids import chunk_id_for, is_legacy_doc_chunk, legacy_doc_chunk_ids
+
+URL = "https://docs.oracle.com/en/cloud/saas/netsuite/ns-online-help/section_N123.html"
+
+
+class Store:
+    """Serves ``get`` pages the way Chroma does."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def get(self, include, limit, offset):
+        page = self.chunks[offset:offset + limit]
+        return {"ids": [chunk_id for chunk_id, _ in page], "metadatas": [metadata for _, metadata in page]}
+
+
+def test_baseline_chunks_are_legacy():
+    # The original indexer let Chroma assign random ids and stored only title and url
+    assert is_legacy_doc_chunk(str(uuid.uuid4()), {"title": "Saved Searches", "url": URL})
+    assert is_legacy_doc_chunk(str(uuid.uuid4()), {"title": "Saved Searches", "url": URL, "source": "netsuite_docs"})
+
+
+def test_current_and_uploaded_chunks_are_kept():
+    assert not is_legacy_doc_chunk(chunk_id_for(URL, 3), {"title": "Saved Searches", "url": URL, "source": "netsuite_docs"})
+    assert not is_legacy_doc_chunk(str(uuid.uuid4()), {"source": "report.pdf", "file_id": 7, "user_id": 1})
+    assert not is_legacy_doc_chunk(str(uuid.uuid4()), None)
+
+
+def test_legacy_ids_are_found_across_pages():
+    legacy = [(str(uuid.uuid4()), {"title": "t", "url": URL}) for _ in range(5)]
+    current = [(chunk_id_for(URL, i), {"title": "t", "url": URL, "source": "netsuite_docs"}) for i in range(5)]
+    uploaded = [(str(uuid.uuid4()), {"file_id": 1, "user_id": 1}) for _ in range(3)]
+    chunks = [chunk for group in zip(legacy, current, uploaded + [None, None]) for chunk in group if chunk]
+
+    assert legacy_doc_chunk_ids(Store(chunks), batch_size=4) == [chunk_id for chunk_id, _ in legacy]
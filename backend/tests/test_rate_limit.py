@@ -0,0 +1,21 @@
+import time
+
+from backend.services.rate_limit import TokenBucket
+
+
+def test_requests_larger_than_the_bucket_are_charged_in_full():
+    bucket = TokenBucket(rate=100, capacity=5)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire(20)
+    # The first request goes into debt; each later one waits until the bucket is refilled
+    assert time.monotonic() - start >= 0.38
+    assert bucket.tokens < 0
+
+
+def test_small_requests_use_the_burst():
+    bucket = TokenBucket(rate=1, capacity=5)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire(1)
+    assert time.monotonic() - start < 0.1
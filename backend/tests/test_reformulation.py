@@ -0,0 +1,62 @@
+from backend.services.reformulation import coverage_hits, needs_reformulation, reusable_speculation
+
+HISTORY = [{"role": "human", "content": "How do I create a saved search?"},
+           {"role": "ai", "content": "Go to Reports > Saved Searches > New."}]
+
+
+def test_first_question_is_never_reformulated():
+    assert not needs_reformulation("What about vendors?", [])
+
+
+def test_self_contained_questions_skip_reformulation():
+    for question in [
+        "How do I create a saved search in NetSuite?",
+        "What is the difference between this role and the Administrator role in NetSuite?",
+        "Is there a way to schedule a workflow that also sends an email?",
+        "How do I set up multi-currency on a subsidiary record",
+        "What permissions are needed to edit other employees' records?",
+    ]:
+        assert not needs_reformulation(question, HISTORY), question
+
+
+def test_follow_ups_are_reformulated():
+    for question in [
+        "for vendors?",
+        "why?",
+        "What about for vendor records?",
+        "And how do I schedule it to run weekly?",
+        "Can you show the same steps for customers?",
+        "How do I share those results with my team?",
+    ]:
+        assert needs_reformulation(question, HISTORY), question
+
+
+def test_speculative_results_reused_for_unchanged_question():
+    result = (["doc"], "hybrid", 1.4)
+    assert reusable_speculation("How do I create a saved search?", ("how do I  create a saved search?", result)) is result
+
+
+def test_speculative_results_ignored_after_rewrite():
+    # The raw follow-up matches trivially on BM25 coverage but lacks the context of the rewrite
+    result = (["doc"], "hybrid", 1 / 0.75)
+    assert reusable_speculation("How do I create a saved search for vendors?", ("for vendors?", result)) is None
+    assert reusable_speculation("anything", None) is None
+
+
+class Doc:
+    def __init__(self, id, page_content):
+        self.id = id
+        self.page_content = page_content
+
+
+def test_coverage_hits_score_speculative_docs_against_the_rewrite():
+    docs = [Doc("a", "Open Reports > Saved Searches > New."),
+            Doc("b", "Vendor records: create a saved search of type Vendor to list vendors.")]
+    hits = coverage_hits("How do I create a saved search for vendors?", docs)
+    assert [hit[0] for hit in hits] == ["b", "a"]
+    assert hits[0][2] == 1.0
+    assert hits[1][2] < 0.75
+
+
+def test_coverage_hits_without_terms():
+    assert coverage_hits("how do I?", [Doc("a", "anything")]) == []